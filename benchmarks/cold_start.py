@@ -0,0 +1,112 @@
+"""Measure import time and first invocation time of the lambda handlers.
+
+Every run happens in a fresh interpreter so module-level work is paid
+again, the way it is on a Lambda cold start. The default events take
+paths that need no AWS calls; pass --event to time a real request.
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py lf2 --runs 20 --max-import-ms 300
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Events that exercise the handler without leaving the process
+DEFAULT_EVENTS = {
+    "lf0": {"messages": []},
+    "lf1": {"sessionState": {"intent": {"name": "GreetingIntent"}}},
+    "lf2": {"Records": []},
+}
+
+# Placeholders for the variables the handlers read at import time
+DEFAULT_ENV = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "QUEUE_URL": "https://sqs.us-east-1.amazonaws.com/000000000000/bench",
+    "OPENSEARCH_HOST": "localhost",
+    "FROM_EMAIL": "bench@example.com",
+}
+
+# Runs inside the child interpreter and prints its timings as JSON
+CHILD = """
+import json, sys, time, types
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+context = types.SimpleNamespace(aws_request_id="bench")
+lambda_function.lambda_handler(json.loads(sys.argv[2]), context)
+invoked = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "invoke_ms": (invoked - imported) * 1000}))
+"""
+
+
+def run_once(function, event):
+    env = dict(DEFAULT_ENV, **os.environ)
+    path = os.path.join(ROOT, "lambda-functions", function)
+
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, path, json.dumps(event)],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+    # Handlers print freely, the timings are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("functions", nargs="*", default=sorted(DEFAULT_EVENTS))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--event", help="JSON file with the event to invoke with")
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        help="exit with an error if any median import time is above this",
+    )
+    args = parser.parse_args()
+
+    custom_event = None
+    if args.event:
+        with open(args.event) as f:
+            custom_event = json.load(f)
+
+    slow = []
+
+    for function in args.functions:
+        event = custom_event if custom_event is not None else DEFAULT_EVENTS[function]
+        runs = [run_once(function, event) for _ in range(args.runs)]
+
+        imports = [run["import_ms"] for run in runs]
+        invokes = [run["invoke_ms"] for run in runs]
+
+        print(
+            f"{function}: import p50 {statistics.median(imports):.1f} ms "
+            f"p90 {percentile(imports, 90):.1f} ms | "
+            f"first invoke p50 {statistics.median(invokes):.1f} ms "
+            f"p90 {percentile(invokes, 90):.1f} ms"
+        )
+
+        if args.max_import_ms is not None and statistics.median(imports) > args.max_import_ms:
+            slow.append(function)
+
+    if slow:
+        print(f"Import time above {args.max_import_ms} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
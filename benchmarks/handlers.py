@@ -0,0 +1,340 @@
+"""Offline throughput benchmark for the LF0, LF1 and LF2 handlers.
+
+SQS, DynamoDB and SES are served by moto; Lex and OpenSearch are small
+in-process fakes. Every stand-in call can be given a fixed latency so
+that batching, caching and concurrency changes show up the way they
+would against the real services. Needs moto (pip install "moto[all]").
+
+    python benchmarks/handlers.py
+    python benchmarks/handlers.py lf2 --messages 500 --batch-size 10 --aws-latency-ms 15
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import defaultdict
+from decimal import Decimal
+
+from cold_start import DEFAULT_ENV, ROOT, percentile
+
+CUISINES = ["Italian", "Mexican", "Japanese", "Indian", "Chinese", "Thai", "Korean", "French"]
+
+
+class Stats:
+    """Latency samples per stage, safe to record from worker threads."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds * 1000)
+
+    def timed(self, stage, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    def report(self, title, messages, elapsed):
+        print(f"\n{title}: {messages} messages in {elapsed:.2f} s, {messages / elapsed:.1f} msg/s")
+        print(f"  {'stage':<34}{'calls':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+        for stage, values in self.samples.items():
+            print(
+                f"  {stage:<34}{len(values):>7}{percentile(values, 50):>10.2f}"
+                f"{percentile(values, 90):>10.2f}{percentile(values, 99):>10.2f}"
+            )
+
+
+class FakeLex:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def recognize_text(self, **kwargs):
+        time.sleep(self.latency)
+        return {
+            "messages": [{"content": "Hi there, how can I help?"}],
+            "sessionState": {"sessionAttributes": kwargs.get("sessionState", {}).get("sessionAttributes", {})},
+        }
+
+
+class FakeOpenSearch:
+    """Answers the cuisine query LF2 sends from an in-memory list."""
+
+    def __init__(self, restaurants, latency):
+        self.latency = latency
+        self.by_cuisine = defaultdict(list)
+        for restaurant in restaurants:
+            self.by_cuisine[restaurant["cuisine"].lower()].append(restaurant["business_id"])
+
+    def search(self, body, index, **params):
+        time.sleep(self.latency)
+        cuisine = json.dumps(body["query"]).lower()
+        ids = next((ids for name, ids in self.by_cuisine.items() if name in cuisine), [])
+        hits = [{"_source": {"RestaurantID": restaurant_id}} for restaurant_id in ids[: body.get("size", 10)]]
+        return {"hits": {"hits": hits}}
+
+
+def inject_aws_latency(seconds):
+    """Delay every botocore call made by sessions created from now on."""
+    import botocore.handlers
+
+    def delay(**kwargs):
+        time.sleep(seconds)
+
+    botocore.handlers.BUILTIN_HANDLERS.append(("before-call.*.*", delay))
+
+    # The default session registered its handlers when it was created
+    import boto3
+    boto3.DEFAULT_SESSION = None
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_handler(function):
+    path = os.path.join(ROOT, "lambda-functions", function)
+    # Sibling modules such as lf2's cache are imported by plain name
+    sys.path.insert(0, path)
+    return load_module(function, os.path.join(path, "lambda_function.py"))
+
+
+def handler_output(args):
+    """Silence the handlers' own prints unless --verbose is given."""
+    if args.verbose:
+        return contextlib.nullcontext()
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def make_restaurants(count):
+    return [
+        {
+            "business_id": f"biz-{i}",
+            "name": f"Restaurant {i}",
+            "address": f"{i} Broadway New York, NY 10001",
+            "coordinates": {
+                "latitude": Decimal(str(round(random.uniform(40.70, 40.87), 6))),
+                "longitude": Decimal(str(round(random.uniform(-74.02, -73.93), 6))),
+            },
+            "num_reviews": random.randint(1, 2000),
+            "rating": Decimal(str(random.choice([2.5, 3.0, 3.5, 4.0, 4.5, 5.0]))),
+            "zip_code": "10001",
+            "cuisine": CUISINES[i % len(CUISINES)],
+        }
+        for i in range(count)
+    ]
+
+
+NEIGHBOURHOODS = ["Manhattan", "Midtown", "Chelsea", "SoHo", "Upper West Side", "East Village"]
+
+
+def make_request(i):
+    return {
+        "location": random.choice(NEIGHBOURHOODS),
+        "cuisine": random.choice(CUISINES),
+        "dining_time": "7 pm",
+        "num_people": str(random.randint(1, 8)),
+        # Distinct emails so LF2's duplicate check does not skip them
+        "email": f"user{i}@example.com",
+        "session_id": f"session-{i}",
+        "insertedAtTimestamp": int(time.time()),
+    }
+
+
+def setup_aws(restaurants):
+    import boto3
+
+    dynamodb = boto3.resource("dynamodb")
+    tables = {
+        "yelp-restaurants": "business_id",
+        "user-search-history": "email",
+        "dining-request-dedupe": "fingerprint",
+        "restaurant-recommendations": "recommendation_key",
+    }
+    for name, key in tables.items():
+        dynamodb.create_table(
+            TableName=name,
+            KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+    with dynamodb.Table("yelp-restaurants").batch_writer() as batch:
+        for restaurant in restaurants:
+            batch.put_item(Item=restaurant)
+
+    precompute = load_module(
+        "precompute_recommendations",
+        os.path.join(ROOT, "utils", "precompute_recommendations.py"),
+    )
+    precompute.store_recommendations(precompute.build_recommendations(restaurants))
+
+    boto3.client("ses").verify_email_identity(EmailAddress=os.environ["FROM_EMAIL"])
+
+    queue_url = boto3.client("sqs").create_queue(QueueName="DiningRequestsQueue")["QueueUrl"]
+    os.environ["QUEUE_URL"] = queue_url
+    return queue_url
+
+
+def bench_lf0(args):
+    lf0 = load_handler("lf0")
+    stats = Stats()
+
+    lex = FakeLex(args.lex_latency_ms / 1000)
+    lex.recognize_text = stats.timed("lex.recognize_text", lex.recognize_text)
+    lf0.get_lex_client = lambda: lex
+    handler = stats.timed("end_to_end", lf0.lambda_handler)
+
+    start = time.perf_counter()
+    with handler_output(args):
+        for i in range(args.messages):
+            event = {
+                "messages": [{"type": "unstructured", "unstructured": {"text": "I want to eat"}}],
+                "sessionId": f"session-{i}",
+            }
+            handler(event, types.SimpleNamespace(aws_request_id=f"req-{i}"))
+
+    stats.report("lf0", args.messages, time.perf_counter() - start)
+
+
+def bench_lf1(args, queue_url):
+    lf1 = load_handler("lf1")
+    stats = Stats()
+
+    lf1.SQS_QUEUE_URL = queue_url
+    for name in ("get_last_search", "store_last_search"):
+        if hasattr(lf1, name):
+            setattr(lf1, name, stats.timed(name, getattr(lf1, name)))
+    handler = stats.timed("end_to_end", lf1.lambda_handler)
+
+    slot_names = {
+        "location": "Location",
+        "cuisine": "Cuisine",
+        "dining_time": "DiningTime",
+        "num_people": "NumberOfPeople",
+        "email": "Email",
+    }
+
+    start = time.perf_counter()
+    with handler_output(args):
+        for i in range(args.messages):
+            request = make_request(i)
+            slots = {
+                slot: {"value": {"interpretedValue": request[field]}}
+                for field, slot in slot_names.items()
+            }
+            event = {
+                "sessionId": f"session-{i}",
+                "sessionState": {"intent": {"name": "DiningSuggestionsIntent", "slots": slots}},
+            }
+            handler(event, None)
+
+    stats.report("lf1", args.messages, time.perf_counter() - start)
+
+
+def bench_lf2(args, restaurants):
+    lf2 = load_handler("lf2")
+    stats = Stats()
+
+    opensearch = FakeOpenSearch(restaurants, args.opensearch_latency_ms / 1000)
+    lf2.get_opensearch = lambda: opensearch
+    lf2.RECOMMENDATION_SOURCE = args.lf2_source
+
+    if args.search_backend == "local":
+        # The index builder imports its scan helper from the utils directory
+        sys.path.insert(0, os.path.join(ROOT, "utils"))
+        build_search_index = load_module(
+            "build_search_index", os.path.join(ROOT, "utils", "build_search_index.py")
+        )
+        lf2.SEARCH_BACKEND = "local"
+        lf2.SEARCH_INDEX_PATH = os.path.join(tempfile.mkdtemp(), "restaurants_index.json.gz")
+        build_search_index.write_snapshot(
+            build_search_index.build_snapshot(restaurants), lf2.SEARCH_INDEX_PATH
+        )
+
+    stages = [
+        "claim_request",
+        "store_last_search",
+        "get_precomputed_restaurants",
+        "get_restaurants_from_opensearch",
+        "get_restaurants_from_local_index",
+        "sample_from_local_index",
+        "get_restaurants_from_dynamodb",
+        "send_emails",
+    ]
+    for name in stages:
+        if hasattr(lf2, name):
+            setattr(lf2, name, stats.timed(name, getattr(lf2, name)))
+    handler = stats.timed("end_to_end (batch)", lf2.lambda_handler)
+
+    start = time.perf_counter()
+    with handler_output(args):
+        for offset in range(0, args.messages, args.batch_size):
+            records = [
+                {"messageId": str(i), "body": json.dumps(make_request(i))}
+                for i in range(offset, min(offset + args.batch_size, args.messages))
+            ]
+            handler({"Records": records}, None)
+
+    stats.report("lf2", args.messages, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("functions", nargs="*", default=["lf0", "lf1", "lf2"])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10, help="SQS records per lf2 invocation")
+    parser.add_argument("--restaurants", type=int, default=2000)
+    parser.add_argument("--aws-latency-ms", type=float, default=10)
+    parser.add_argument("--opensearch-latency-ms", type=float, default=30)
+    parser.add_argument("--lex-latency-ms", type=float, default=80)
+    parser.add_argument("--search-backend", choices=["opensearch", "local"], default="opensearch")
+    parser.add_argument("--lf2-source", choices=["search", "precomputed"], default="search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the handlers' own output")
+    args = parser.parse_args()
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    # moto only needs credentials to be present
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    from moto import mock_aws
+
+    random.seed(args.seed)
+    restaurants = make_restaurants(args.restaurants)
+
+    with mock_aws():
+        queue_url = setup_aws(restaurants)
+        # Added after setup so seeding the stand-ins is not slowed down
+        inject_aws_latency(args.aws_latency_ms / 1000)
+
+        if "lf0" in args.functions:
+            bench_lf0(args)
+        if "lf1" in args.functions:
+            bench_lf1(args, queue_url)
+        if "lf2" in args.functions:
+            bench_lf2(args, restaurants)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,15 +19,82 @@
 
 
 import json
+import re
 import boto3
+from collections import OrderedDict
+from functools import lru_cache
+from metrics import debug, instrumented, record, timed
+
+# Lex client is built on first use and reused across warm invocations
+@lru_cache(maxsize=None)
+def get_lex_client():
+    return boto3.client('lexv2-runtime', region_name='us-east-1')  # Change to your region
+
+# Greetings and thank-yous are answered here with the same replies LF1 gives
+# for GreetingIntent and ThankYouIntent, saving the Lex and LF1 round trip.
+# Only exact matches after normalization are handled, anything else goes to Lex.
+GREETING_REPLY = "Hi there, how can I help?"
+THANK_YOU_REPLY = "You're welcome! Have a great day!"
+
+LOCAL_REPLIES = {
+    **dict.fromkeys([
+        "hi", "hello", "hey", "hi there", "hello there", "hey there",
+        "good morning", "good afternoon", "good evening", "howdy",
+    ], GREETING_REPLY),
+    **dict.fromkeys([
+        "thanks", "thank you", "thanks a lot", "thank you so much",
+        "thanks so much", "thx", "ty", "many thanks", "thank you very much",
+    ], THANK_YOU_REPLY),
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+# Sessions whose last Lex turn closed the dialog. Lex keeps the dialog state,
+# so sessions this container has not seen are treated as possibly mid-dialog.
+MAX_TRACKED_SESSIONS = 10000
+closed_sessions = OrderedDict()
+
+def local_reply(user_message, session_id, is_new_session):
+    """Return a canned reply for trivial utterances outside a dialog, else None."""
+    if not is_new_session and session_id not in closed_sessions:
+        return None
+
+    return LOCAL_REPLIES.get(" ".join(_PUNCTUATION.sub(" ", user_message.lower()).split()))
+
+def mark_closed(session_id):
+    """Remember a session as outside a dialog, evicting the oldest past the limit."""
+    closed_sessions[session_id] = True
+    closed_sessions.move_to_end(session_id)
+    if len(closed_sessions) > MAX_TRACKED_SESSIONS:
+        closed_sessions.popitem(last=False)
+
+def track_dialog(session_id, lex_response):
+    dialog_action = lex_response.get('sessionState', {}).get('dialogAction', {})
+
+    if dialog_action.get('type') == 'Close':
+        mark_closed(session_id)
+    else:
+        closed_sessions.pop(session_id, None)
+
+def build_response(session_id, text, session_attributes):
+    return {
+        "session_id": session_id,
+        "messages": [
+            {
+                "type": "unstructured",
+                "unstructured": {
+                    "text": text,
+                    "session_attributes": session_attributes,
+                }
+            }
+        ]
+    }
 
-# Initialize Lex client
-lex_client = boto3.client('lexv2-runtime', region_name='us-east-1')  # Change to your region
-
+@instrumented("lf0")
 def lambda_handler(event, context):
     try:
 
-        print(event)
+        debug(event)
         # Extract request body
         body = event
         
@@ -47,53 +114,54 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "No text provided"})
             }
 
-        print(f"User said: {user_message}")
+        debug(f"User said: {user_message}")
 
-        session_id = body.get('sessionId', context.aws_request_id)
+        session_id = body.get('sessionId')
+        is_new_session = not session_id
 
         if not session_id:
             session_id = context.aws_request_id
 
-        print(f"Session ID: {session_id}")
+        debug(f"Session ID: {session_id}")
 
         session_attributes = body.get('sessionAttributes', {})
 
+        reply = local_reply(user_message, session_id, is_new_session)
+        if reply:
+            record("local_replies", 1, "Count")
+            mark_closed(session_id)
+            return build_response(session_id, reply, session_attributes)
+
         # Send request to Lex
-        lex_response = lex_client.recognize_text(
-            botId='KNXCF8ZMU2',  # Replace with your Lex bot ID
-            botAliasId='TSTALIASID',  # Replace with Lex bot alias ID
-            localeId='en_US',
-            sessionId=session_id,  # Unique session ID
-            text=user_message,
-            sessionState={
-                'sessionAttributes': session_attributes
-            }
-        )
+        request = {
+            'botId': 'KNXCF8ZMU2',  # Replace with your Lex bot ID
+            'botAliasId': 'TSTALIASID',  # Replace with Lex bot alias ID
+            'localeId': 'en_US',
+            'sessionId': session_id,  # Unique session ID
+            'text': user_message,
+        }
+
+        # Sending a session state replaces the one Lex holds, so only do it
+        # when the client round-trips its attributes. Otherwise Lex keeps the
+        # attributes LF1 stored, such as the user's last search.
+        if session_attributes:
+            request['sessionState'] = {'sessionAttributes': session_attributes}
+
+        with timed("lex.recognize_text"):
+            lex_response = get_lex_client().recognize_text(**request)
 
         # Extract Lex response message
         lex_messages = lex_response.get('messages', [])
         lex_message = lex_messages[0]['content'] if lex_messages else "I didn't understand that."
 
-        print(lex_response)
-        print(lex_messages)
+        debug(lex_response)
+
+        track_dialog(session_id, lex_response)
 
         lex_session_attributes = lex_response.get('sessionState', {}).get('sessionAttributes', {})
 
         # Format API response
-        api_response = {
-            "session_id": session_id,
-            "messages": [
-                {
-                    "type": "unstructured",
-                    "unstructured": {
-                        "text": lex_message,
-                        "session_attributes": lex_session_attributes,
-                    }
-                }
-            ]
-        }
-
-        return api_response
+        return build_response(session_id, lex_message, lex_session_attributes)
 
     except Exception as e:
         print(f"Error calling Lex: {e}")
@@ -1,80 +1,98 @@
 import json
 import boto3
 import time
+from functools import lru_cache
+from metrics import debug, instrumented, timed
+from utils import DINING_SLOTS, validate_dining_slots
+
+# Clients are built on first use, greetings never need them
+@lru_cache(maxsize=None)
+def get_sqs():
+    return boto3.client('sqs')
+
+@lru_cache(maxsize=None)
+def get_dynamodb():
+    return boto3.client('dynamodb')
 
-# Initialize client
-sqs = boto3.client('sqs')
-dynamodb = boto3.client('dynamodb')
 user_pref_table = 'user-search-history'
 
 # Replace with your actual SQS queue URL
 SQS_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/699475932675/DiningRequestsQueue"
 
-def get_last_search(user_email):
-    response = dynamodb.get_item(
-        TableName=user_pref_table,
-        Key={"email": {"S": user_email}}
-    )
+# The last search is kept in the Lex session as a compact JSON list in this
+# field order, so returning users in the same session skip the table read
+LAST_SEARCH_ATTRIBUTE = "lastSearch"
+LAST_SEARCH_FIELDS = ["email", "location", "cuisine", "dining_time", "num_people"]
+MAX_LAST_SEARCH_LENGTH = 512
+
+def encode_last_search(search):
+    encoded = json.dumps([search[field] for field in LAST_SEARCH_FIELDS], separators=(",", ":"))
+    return encoded if len(encoded) <= MAX_LAST_SEARCH_LENGTH else None
+
+def decode_last_search(session_attributes):
+    try:
+        values = json.loads(session_attributes.get(LAST_SEARCH_ATTRIBUTE) or "null")
+    except ValueError:
+        return None
+
+    if not isinstance(values, list) or len(values) != len(LAST_SEARCH_FIELDS):
+        return None
+
+    return dict(zip(LAST_SEARCH_FIELDS, values))
+
+def remember_last_search(session_attributes, search):
+    encoded = encode_last_search(search)
+    if encoded:
+        session_attributes[LAST_SEARCH_ATTRIBUTE] = encoded
+
+def get_last_search(user_email, session_attributes):
+    last_search = decode_last_search(session_attributes)
+    if last_search and last_search["email"] == user_email:
+        return last_search
+
+    with timed("dynamodb.get_item"):
+        response = get_dynamodb().get_item(
+            TableName=user_pref_table,
+            Key={"email": {"S": user_email}},
+            # location is a reserved word, so every field goes through a name
+            ProjectionExpression=", ".join(f"#{field}" for field in LAST_SEARCH_FIELDS),
+            ExpressionAttributeNames={f"#{field}": field for field in LAST_SEARCH_FIELDS},
+        )
     
     if 'Item' in response:
-        return {
-            "location": response['Item'].get("location", {}).get("S"),
-            "cuisine": response['Item'].get("cuisine", {}).get("S"),
-            "dining_time": response['Item'].get("dining_time", {}).get("S"),
-            "num_people": response['Item'].get("num_people", {}).get("S"),
-            "email": response['Item'].get("email", {}).get("S")
+        last_search = {
+            field: response['Item'].get(field, {}).get("S")
+            for field in LAST_SEARCH_FIELDS
         }
+        remember_last_search(session_attributes, last_search)
+        return last_search
 
     return None
 
-def store_last_search(session_id, body):
-
-    user_email = body['email']
-    location = body['location']
-    cuisine = body['cuisine']
-    dining_time = body['dining_time']
-    num_people = body['num_people']
-
-    dynamodb.put_item(
-        TableName=user_pref_table,
-        Item={
-            "session_id": {"S": session_id},
-            "email": {"S": user_email},
-            "location": {"S": location},
-            "cuisine": {"S": cuisine},
-            "dining_time": {"S": dining_time},
-            "num_people": {"S": num_people},
-            "timestamp": {"N": str(int(time.time()))}
-        }
-    )
-
-    return
-
+@instrumented("lf1")
 def lambda_handler(event, context):
 
-    print("EVENT")
-    print(event)
-
-    print("CONTEXT")
-    print(context)
+    debug(event)
 
 
     intent_name = event['sessionState']['intent']['name']
+    session_attributes = event['sessionState'].get('sessionAttributes')
 
     if intent_name == "GreetingIntent":
-        return generate_response("Hi there, how can I help?")
+        return generate_response("Hi there, how can I help?", session_attributes)
 
     elif intent_name == "DiningSuggestionsIntent":
         return handle_dining_suggestions(event)
 
     elif intent_name == "ThankYouIntent":
-        return generate_response("You're welcome! Have a great day!")
+        return generate_response("You're welcome! Have a great day!", session_attributes)
 
     else:
-        return generate_response("I'm not sure how to handle that request.")
+        return generate_response("I'm not sure how to handle that request.", session_attributes)
 
 def handle_dining_suggestions(event):
     slots = event['sessionState']['intent']['slots']
+    session_attributes = event['sessionState'].get('sessionAttributes') or {}
     
     # Extract slot values
 
@@ -85,12 +103,15 @@ def handle_dining_suggestions(event):
             return slot['value'].get('interpretedValue')
         return None  # Return None if the slot or value is missing
 
-    email = get_slot_value('Email')
+    values = {slot['name']: get_slot_value(slot['name']) for slot in DINING_SLOTS}
+    invalid, missing = validate_dining_slots(values)
+
+    email = values['Email']
 
-    if email:
-        last_search = get_last_search(email)
+    if email and not any(slot['name'] == 'Email' for slot in invalid):
+        last_search = get_last_search(email, session_attributes)
         if last_search:
-            print(last_search)
+            debug(last_search)
             
             # Create message payload
             message = {
@@ -103,14 +124,16 @@ def handle_dining_suggestions(event):
             }
 
             # Push to SQS queue
-            sqs.send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=json.dumps(message))
+            with timed("sqs.send_message"):
+                get_sqs().send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=json.dumps(message))
 
             return {
                 "sessionState": {
                     "dialogAction": {
                         "type": "Close"
                     },
-                    "intent": event['sessionState']['intent']
+                    "intent": event['sessionState']['intent'],
+                    "sessionAttributes": session_attributes
                 },
                 "messages": [
                     {
@@ -121,83 +144,77 @@ def handle_dining_suggestions(event):
             }
 
 
-    location = get_slot_value('Location')
+    # Every rejected value is reported and cleared in the same turn, so the
+    # user can correct them together instead of one round trip per slot
+    if invalid:
+        intent = dict(event['sessionState']['intent'])
+        intent['slots'] = dict(slots, **{slot['name']: None for slot in invalid})
 
-    # Validate the data, ensure location is only Manhattan and request location again
-    
-    if location and location.lower() != 'manhattan':
         return {
             "sessionState": {
                 "dialogAction": {
                     "type": "ElicitSlot",
-                    "slotToElicit": "Location"
+                    "slotToElicit": invalid[0]['name']
                 },
-                "intent": event['sessionState']['intent']
+                "intent": intent,
+                "sessionAttributes": session_attributes
             },
             "messages": [
                 {
                     "contentType": "PlainText",
-                    "content": "Please enter a valid location."
+                    "content": " ".join(slot['invalid'] for slot in invalid)
                 }
             ]
         }
 
-
-    cuisine = get_slot_value('Cuisine')
-    dining_time = get_slot_value('DiningTime')
-    num_people = get_slot_value('NumberOfPeople')
-    
-
-    missing_slots = []
-
-    if not email:
-        missing_slots.append({'slot' : 'Email', 'message': "Please provide your email address" })
-    if not location:
-        missing_slots.append({'slot' : 'Location', 'message': "What city or city area are you looking to dine in?" })
-    if not cuisine:
-        missing_slots.append({'slot' : 'Cuisine', 'message': "What cuisine are you looking for? (Ex. Indian, Italian, Chinese, etc.)" })
-    if not dining_time:
-        missing_slots.append({'slot' : 'DiningTime', 'message': "What time?" })
-    if not num_people:
-        missing_slots.append({'slot' : 'NumberOfPeople', 'message': "How many people in your party?" })
-
-    if missing_slots:
+    if missing:
         return {
             "sessionState": {
                 "dialogAction": {
                     "type": "ElicitSlot",
-                    "slotToElicit": missing_slots[0]['slot']  # Ask for the first missing slot
+                    "slotToElicit": missing[0]['name']  # Ask for the first missing slot
                 },
-                "intent": event['sessionState']['intent']
+                "intent": event['sessionState']['intent'],
+                "sessionAttributes": session_attributes
             },
             "messages": [
                 {
                     "contentType": "PlainText",
-                    "content": missing_slots[0]['message']
+                    "content": missing[0]['prompt']
                 }
             ]
         }
 
+    location = values['Location']
+    cuisine = values['Cuisine']
+    dining_time = values['DiningTime']
+    num_people = values['NumberOfPeople']
 
-    # Create message payload
+    # Create message payload, the session ID tells LF2 to save this as the
+    # user's last search once the message is processed
     message = {
         "location": location,
         "cuisine": cuisine,
         "dining_time": dining_time,
         "num_people": num_people,
         "email": email,
+        "session_id": event['sessionId'],
         "insertedAtTimestamp": int(time.time())
     }
 
     # Push to SQS queue
-    sqs.send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=json.dumps(message))
+    with timed("sqs.send_message"):
+        get_sqs().send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=json.dumps(message))
 
-    store_last_search(event['sessionId'], message)
+    remember_last_search(session_attributes, message)
 
     # Confirmation message
-    return generate_response(f"Thanks! We received your request for {cuisine} food in {location} for {num_people} people at {dining_time}. We'll email suggestions to {email} soon!")
+    return generate_response(
+        f"Thanks! We received your request for {cuisine} food in {location} for {num_people} people at {dining_time}. We'll email suggestions to {email} soon!",
+        session_attributes
+    )
 
-def generate_response(message):
+def generate_response(message, session_attributes=None):
     return {
         "sessionState": {
             "dialogAction": {
@@ -206,7 +223,8 @@ def generate_response(message):
             "intent": {
                 "name": "DiningSuggestionsIntent",
                 "state": "Fulfilled"
-            }
+            },
+            "sessionAttributes": session_attributes or {}
         },
         "messages": [
             {
@@ -1,5 +1,5 @@
 # --- Helper Functions for Lex Responses ---
-import datetime
+import re
 
 # --- Lex Response Helper Functions ---
 def elicit_slot(session_attributes, intent_name, slots, slot_to_elicit, message):
@@ -58,62 +58,84 @@ def build_validation_result(is_valid, violated_slot, message_content):
         }
     return {'isValid': True}
 
-# --- Slot Validation Functions ---
-def is_valid_city(city):
-    """Check if the city is valid for this bot."""
-    valid_cities = ['new york', 'seattle', 'san francisco', 'chicago', 'boston', 'los angeles', 'houston', 'miami']
-    return city.lower() in valid_cities
+# --- Dining Slot Schema ---
+# Compiled once at import. Slots are listed in the order they are asked for.
+# Manhattan and its neighbourhoods, LF2 ranks restaurants by distance from
+# the neighbourhood. Keep in step with lf2/neighbourhoods.py.
+SUPPORTED_LOCATIONS = frozenset([
+    'manhattan', 'midtown', 'upper east side', 'upper west side', 'harlem',
+    'east harlem', 'washington heights', 'inwood', "hell's kitchen", 'chelsea',
+    'flatiron', 'gramercy', 'murray hill', 'kips bay', 'greenwich village',
+    'west village', 'east village', 'soho', 'nolita', 'little italy',
+    'lower east side', 'chinatown', 'tribeca', 'financial district',
+])
 
-def is_valid_date(date):
-    """Check if the date is a valid future date and not too far in the future."""
-    try:
-        check_in_date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
-        if check_in_date < datetime.date.today():
-            return False, "The check-in date cannot be in the past. Can you provide a future date?"
-        if check_in_date > datetime.date.today() + datetime.timedelta(days=365):
-            return False, "You cannot book more than a year in advance. Please choose a closer date."
-        return True, None
-    except ValueError:
-        return False, "The date format is invalid. Please use YYYY-MM-DD format."
+SUPPORTED_CUISINES = frozenset([
+    'italian', 'mexican', 'japanese', 'indian', 'chinese', 'thai',
+    'mediterranean', 'continental', 'korean', 'french', 'american',
+])
 
-def is_valid_nights(nights):
-    """Check if the number of nights is a positive integer and not too large."""
-    try:
-        nights = int(nights)
-        if nights <= 0:
-            return False, "The number of nights should be a positive integer. Please provide a valid number."
-        if nights > 30:
-            return False, "We do not allow bookings for more than 30 nights. Please enter a shorter stay."
-        return True, None
-    except ValueError:
-        return False, "The number of nights should be a valid integer."
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$')
 
-def is_valid_room_type(room_type):
-    """Check if the room type is valid and suggest alternatives if not."""
-    valid_room_types = ['single', 'double', 'suite', 'deluxe']
-    if room_type.lower() not in valid_room_types:
-        return False, f"We only have Single, Double, Suite, or Deluxe rooms. Please specify one of these room types."
-    return True, None
+# Lex AMAZON.Time values (14:30, or MO/AF/EV/NI for a time of day) and typed times (7 pm, 7:30pm)
+TIME_PATTERN = re.compile(
+    r'^(?:(?:[01]?\d|2[0-3]):[0-5]\d|MO|AF|EV|NI|(?:0?[1-9]|1[0-2])(?::[0-5]\d)?\s*[ap]\.?m\.?)$',
+    re.IGNORECASE
+)
 
-# --- Main Validation Function ---
-def validate_hotel_booking(location, check_in_date, nights, room_type):
-    """Perform validation for all slots with advanced checks."""
-    if location and not is_valid_city(location):
-        return build_validation_result(False, 'Location', f"We do not support {location} yet. Please choose from: New York, Seattle, San Francisco, Chicago, Boston, Los Angeles, Houston, or Miami.")
-    
-    if check_in_date:
-        date_valid, date_message = is_valid_date(check_in_date)
-        if not date_valid:
-            return build_validation_result(False, 'CheckInDate', date_message)
+MAX_PARTY_SIZE = 20
 
-    if nights:
-        nights_valid, nights_message = is_valid_nights(nights)
-        if not nights_valid:
-            return build_validation_result(False, 'Nights', nights_message)
+def is_valid_party_size(value):
+    return value.isdigit() and 1 <= int(value) <= MAX_PARTY_SIZE
 
-    if room_type:
-        room_type_valid, room_type_message = is_valid_room_type(room_type)
-        if not room_type_valid:
-            return build_validation_result(False, 'RoomType', room_type_message)
+DINING_SLOTS = [
+    {
+        'name': 'Email',
+        'prompt': "Please provide your email address",
+        'is_valid': lambda value: bool(EMAIL_PATTERN.match(value)),
+        'invalid': "That doesn't look like a valid email address.",
+    },
+    {
+        'name': 'Location',
+        'prompt': "What city or city area are you looking to dine in?",
+        'is_valid': lambda value: value.strip().lower() in SUPPORTED_LOCATIONS,
+        'invalid': "Please enter a valid location. We currently only cover Manhattan and its neighbourhoods.",
+    },
+    {
+        'name': 'Cuisine',
+        'prompt': "What cuisine are you looking for? (Ex. Indian, Italian, Chinese, etc.)",
+        'is_valid': lambda value: value.strip().lower() in SUPPORTED_CUISINES,
+        'invalid': "We don't have suggestions for that cuisine yet. Try Indian, Italian, Chinese, Japanese, Thai or Mexican.",
+    },
+    {
+        'name': 'DiningTime',
+        'prompt': "What time?",
+        'is_valid': lambda value: bool(TIME_PATTERN.match(value.strip())),
+        'invalid': "Please give a time such as 7 pm or 19:30.",
+    },
+    {
+        'name': 'NumberOfPeople',
+        'prompt': "How many people in your party?",
+        'is_valid': lambda value: is_valid_party_size(value.strip()),
+        'invalid': f"Party size should be a number between 1 and {MAX_PARTY_SIZE}.",
+    },
+]
 
-    return {'isValid': True, 'violatedSlot': None, 'message': None}
\ No newline at end of file
+def validate_dining_slots(values):
+    """Check every dining slot in one pass.
+
+    values maps slot names to their interpreted values (None when empty).
+    Returns (invalid, missing): the definitions of slots whose value was
+    rejected and of slots that have no value yet, both in prompt order.
+    """
+    invalid = []
+    missing = []
+
+    for slot in DINING_SLOTS:
+        value = values.get(slot['name'])
+        if not value:
+            missing.append(slot)
+        elif not slot['is_valid'](value):
+            invalid.append(slot)
+
+    return invalid, missing
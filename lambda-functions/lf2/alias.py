@@ -0,0 +1,58 @@
+import math
+import random
+from array import array
+
+
+def restaurant_weight(rating, num_reviews):
+    """Sampling weight of a restaurant.
+
+    Grows with the square of the rating, and with the log of the review
+    count so a handful of reviews counts for less than hundreds.
+    """
+    rating = float(rating or 0)
+    num_reviews = int(num_reviews or 0)
+    return rating * rating * math.log(2 + num_reviews)
+
+
+class AliasTable:
+    """Walker's alias method: O(n) to build, O(1) per weighted draw.
+
+    Each of the n slots holds a probability and an alias. A draw picks a
+    slot uniformly and keeps it with that probability, otherwise it takes
+    the alias.
+    """
+
+    def __init__(self, weights):
+        n = len(weights)
+        self.prob = array("d", [1.0]) * n
+        self.alias = array("l", range(n))
+
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            # Nothing to weight by, every slot keeps itself: a uniform draw
+            return
+
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        # Pair each under-full slot with an over-full one that tops it up
+        while small and large:
+            under = small.pop()
+            over = large.pop()
+            self.prob[under] = scaled[under]
+            self.alias[under] = over
+            scaled[over] = scaled[over] + scaled[under] - 1.0
+            (small if scaled[over] < 1.0 else large).append(over)
+
+        # Whatever is left is 1.0 up to rounding
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def draw(self, rng=random):
+        """Return a slot index with probability proportional to its weight."""
+        i = int(rng.random() * len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def __len__(self):
+        return len(self.prob)
@@ -1,15 +1,36 @@
 import json
 import boto3
+import hashlib
+import time
 import random
 import os
-from botocore.exceptions import ClientError
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
-
-# Initialize AWS services
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
-ses = boto3.client('ses')
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from alias import AliasTable, restaurant_weight
+from cache import TTLCache
+from neighbourhoods import centroid
+from metrics import debug, instrumented, record, timed
+
+# AWS clients are built on first use so the cold start only pays for what
+# the invocation needs. SQS and SES are only used from the handler thread.
+@lru_cache(maxsize=None)
+def get_sqs():
+    return boto3.client('sqs')
+
+@lru_cache(maxsize=None)
+def get_ses():
+    return boto3.client('ses')
+
+# boto3 resources and the default session are not thread-safe, each worker
+# thread builds its own from a private session
+_local = threading.local()
+
+def get_dynamodb():
+    if not hasattr(_local, "dynamodb"):
+        _local.dynamodb = boto3.session.Session().resource('dynamodb')
+    return _local.dynamodb
 
 # Get environment variables
 QUEUE_URL = os.environ['QUEUE_URL']
@@ -17,104 +38,252 @@ REGION = os.environ['AWS_REGION']
 OPENSEARCH_HOST = os.environ['OPENSEARCH_HOST']
 FROM_EMAIL = os.environ['FROM_EMAIL']
 
-# Set up OpenSearch client
-credentials = boto3.Session().get_credentials()
-awsauth = AWS4Auth(
-    credentials.access_key,
-    credentials.secret_key,
-    REGION,
-    'es',
-    session_token=credentials.token
+RESTAURANT_TABLE = "yelp-restaurants"
+HISTORY_TABLE = os.environ.get("HISTORY_TABLE", "user-search-history")
+
+# "search" picks from OpenSearch hits and the catalog table. "precomputed"
+# reads one record of shuffled candidates per cuisine and location, written
+# by utils/precompute_recommendations.py, and skips OpenSearch entirely.
+RECOMMENDATION_SOURCE = os.environ.get("RECOMMENDATION_SOURCE", "search")
+RECOMMENDATION_TABLE = os.environ.get("RECOMMENDATION_TABLE", "restaurant-recommendations")
+
+# The catalog rarely changes, so restaurant items are kept across warm invocations
+restaurant_cache = TTLCache(
+    max_size=int(os.environ.get("RESTAURANT_CACHE_SIZE", "5000")),
+    ttl_seconds=int(os.environ.get("RESTAURANT_CACHE_TTL", "3600")),
 )
 
-opensearch_client = OpenSearch(
-    hosts=[{'host': OPENSEARCH_HOST, 'port': 443}],
-    http_auth=awsauth,
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection
+# Candidate IDs per cuisine, sampled locally instead of searching for every message
+CANDIDATE_POOL_SIZE = int(os.environ.get("CANDIDATE_POOL_SIZE", "25"))
+candidate_cache = TTLCache(
+    max_size=100,
+    ttl_seconds=int(os.environ.get("CANDIDATE_CACHE_TTL", "900")),
 )
+recommendation_cache = TTLCache(
+    max_size=100,
+    ttl_seconds=int(os.environ.get("CANDIDATE_CACHE_TTL", "900")),
+)
+
+OPENSEARCH_TIMEOUT = int(os.environ.get("OPENSEARCH_TIMEOUT", "5"))
+
+# "opensearch" queries the cluster, "local" searches an in-process index
+# loaded from a snapshot built by utils/build_search_index.py. The snapshot
+# is bundled with the function or downloaded once into /tmp from S3.
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "opensearch")
+SEARCH_INDEX_PATH = os.environ.get(
+    "SEARCH_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "restaurants_index.json.gz"),
+)
+SEARCH_INDEX_S3_URI = os.environ.get("SEARCH_INDEX_S3_URI")
+
+# With the local backend, candidates are ranked by distance from the requested
+# neighbourhood as well as rating: one more star is worth this many km
+KM_PER_STAR = float(os.environ.get("KM_PER_STAR", "1.0"))
+
+_opensearch_client = None
+_opensearch_lock = threading.Lock()
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+def get_local_index():
+    """Load the search index snapshot once, shared by all worker threads.
 
+    local_index (and NumPy with it) is imported here so the default
+    OpenSearch backend never pays for it on a cold start.
+    """
+    global _local_index
+
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                from local_index import RestaurantIndex
+
+                path = SEARCH_INDEX_PATH
+
+                if SEARCH_INDEX_S3_URI:
+                    # /tmp survives across warm invocations of this container
+                    bucket, key = SEARCH_INDEX_S3_URI.replace("s3://", "", 1).split("/", 1)
+                    path = os.path.join("/tmp", os.path.basename(key))
+                    if not os.path.exists(path):
+                        # Downloaded aside and renamed, so an interrupted
+                        # download never leaves a truncated snapshot behind
+                        partial_path = f"{path}.partial"
+                        boto3.session.Session().client('s3').download_file(bucket, key, partial_path)
+                        os.replace(partial_path, path)
+
+                with timed("local_index.load"):
+                    _local_index = RestaurantIndex.load(path)
+
+                print(f"Loaded {len(_local_index)} restaurants from {path}")
+
+    return _local_index
+
+def get_opensearch():
+    """Build the OpenSearch client on first use, shared by all worker threads.
+
+    opensearchpy and requests_aws4auth are imported here so invocations
+    served from the candidate cache never load them.
+    """
+    global _opensearch_client
+
+    if _opensearch_client is None:
+        with _opensearch_lock:
+            if _opensearch_client is None:
+                from opensearchpy import OpenSearch, RequestsHttpConnection
+                from requests_aws4auth import AWS4Auth
+
+                credentials = boto3.session.Session().get_credentials()
+                awsauth = AWS4Auth(
+                    credentials.access_key,
+                    credentials.secret_key,
+                    REGION,
+                    'es',
+                    session_token=credentials.token
+                )
+
+                # One keep-alive connection per worker so concurrent searches
+                # reuse TLS sessions instead of reconnecting
+                _opensearch_client = OpenSearch(
+                    hosts=[{'host': OPENSEARCH_HOST, 'port': 443}],
+                    http_auth=awsauth,
+                    use_ssl=True,
+                    verify_certs=True,
+                    connection_class=RequestsHttpConnection,
+                    pool_maxsize=MAX_WORKERS,
+                    timeout=OPENSEARCH_TIMEOUT,
+                    max_retries=2,
+                    retry_on_timeout=True,
+                )
+
+    return _opensearch_client
+
+# Identical requests inside this window are only answered once. Claims are
+# shared through DynamoDB (TTL on expires_at); answered ones are also
+# remembered locally.
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE", "dining-request-dedupe")
+DEDUPE_WINDOW_SECONDS = int(os.environ.get("DEDUPE_WINDOW_SECONDS", "600"))
+# A claim is held "in_progress" for this long and becomes "done" once SES
+# accepts the email. Keep it below the queue's visibility timeout, so a
+# message redelivered after a timeout or crash finds the lease expired.
+CLAIM_LEASE_SECONDS = int(os.environ.get("CLAIM_LEASE_SECONDS", "25"))
+# Maps answered fingerprints to the epoch second their claim expires
+seen_requests = TTLCache(max_size=10000, ttl_seconds=DEDUPE_WINDOW_SECONDS)
+
+# SES template for recommendation emails, created on first send when missing.
+# It is never updated from here (SES template calls are tightly rate limited),
+# so give a changed template a new name, e.g. RestaurantRecommendation-v2.
+EMAIL_TEMPLATE = os.environ.get("EMAIL_TEMPLATE", "RestaurantRecommendation")
+MAX_BULK_DESTINATIONS = 50  # SES limit for send_bulk_templated_email
+
+EMAIL_SUBJECT = "Your {{cuisine}} Restaurant Recommendation"
+
+EMAIL_HTML = """
+<html>
+<head></head>
+<body>
+    <h1>Your Restaurant Recommendation</h1>
+    <p>Hello!</p>
+    <p>Based on your request for {{cuisine}} cuisine in {{location}} for {{num_people}} people on {{dining_time}}, we recommend:</p>
+    <h2>{{name}}</h2>
+    <p><strong>Address:</strong> {{address}}</p>
+    <p><strong>Phone:</strong> {{phone}}</p>
+    <p><strong>Rating:</strong> {{rating}} stars</p>
+    <p><strong>Review Count:</strong> {{review_count}}</p>
+    <p><strong>Price:</strong> {{price}}</p>
+    <p>Enjoy your meal!</p>
+</body>
+</html>
+"""
+
+EMAIL_TEXT = """
+Your Restaurant Recommendation
+
+Hello!
+
+Based on your request for {{cuisine}} cuisine in {{location}} for {{num_people}} people on {{dining_time}}, we recommend:
+
+{{name}}
+Address: {{address}}
+Phone: {{phone}}
+Rating: {{rating}} stars
+Review Count: {{review_count}}
+Price: {{price}}
+
+Enjoy your meal!
+"""
+
+email_template_ready = False
+
+# Batch size for a single receive; SQS caps this at 10
+MAX_MESSAGES = int(os.environ.get("MAX_MESSAGES", "10"))
+WAIT_TIME_SECONDS = int(os.environ.get("WAIT_TIME_SECONDS", "5"))
+
+# Messages are processed concurrently so their network waits overlap. The
+# pool is kept across warm invocations along with its threads' clients.
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "10"))
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+@instrumented("lf2")
 def lambda_handler(event, context):
-    try:
-        # Pull message from SQS queue
+    # Pushed by an SQS event source mapping; polling is kept as a fallback
+    # for scheduled or manual invocations
+    if "Records" in event:
+        return handle_sqs_records(event["Records"])
 
-        print("Connecting to queue")
-        print(f"Queue URL: {QUEUE_URL}")
-        print(f"Region: {REGION}")
+    return poll_queue()
 
-        response = sqs.receive_message(
-            QueueUrl=QUEUE_URL, MaxNumberOfMessages=1, WaitTimeSeconds=5
-        )
+def handle_sqs_records(records):
+    """Process a batch delivered by the SQS trigger.
 
-        print(response)
+    Requires ReportBatchItemFailures on the event source mapping: Lambda
+    deletes every record that is not listed in batchItemFailures.
+    """
+    print(f"Received {len(records)} records from SQS")
 
-        if "Messages" not in response:
-            print("No messages in queue")
-            return {"statusCode": 200, "body": json.dumps("No messages to process")}
+    failures = process_batch(
+        [(record["messageId"], record["body"]) for record in records]
+    )
 
-        message = response["Messages"][0]
-        receipt_handle = message["ReceiptHandle"]
-        message_body = json.loads(message["Body"])
-
-        # Extract required information from the message
-        cuisine = message_body.get("cuisine")
-        user_email = message_body.get("email")
-        location = message_body.get("location", "Manhattan")
-        dining_time = message_body.get("dining_time", "today")
-        num_people = message_body.get("num_people", "2")
-
-        print(message_body)
-
-        if not cuisine or not user_email:
-            print("Missing required fields in message")
-            # Delete the message from the queue
-            sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
-            return {
-                "statusCode": 400,
-                "body": json.dumps("Missing required fields in message"),
-            }
+    return {
+        "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]
+    }
 
-        # Get restaurant recommendation from OpenSearch
-        restaurants = get_restaurants_from_opensearch(cuisine)
+def poll_queue():
+    try:
+        # Pull a batch of messages from SQS queue
 
-        if not restaurants:
-            print(f"No restaurants found for cuisine: {cuisine}")
-            # Delete the message from the queue
-            sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
-            return {
-                "statusCode": 404,
-                "body": json.dumps(f"No restaurants found for cuisine: {cuisine}"),
-            }
+        debug(f"Polling {QUEUE_URL} in {REGION}")
 
-        # Select a random restaurant
-        restaurant_id = random.choice(restaurants)
+        with timed("sqs.receive_message"):
+            response = get_sqs().receive_message(
+                QueueUrl=QUEUE_URL,
+                MaxNumberOfMessages=MAX_MESSAGES,
+                WaitTimeSeconds=WAIT_TIME_SECONDS,
+            )
 
-        # Get detailed restaurant information from DynamoDB
-        restaurant_details = get_restaurant_from_dynamodb(restaurant_id)
+        debug(response)
 
-        if not restaurant_details:
-            print(f"Restaurant details not found for ID: {restaurant_id}")
-            # Delete the message from the queue
-            sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
-            return {
-                "statusCode": 404,
-                "body": json.dumps(f"Restaurant details not found for ID: {restaurant_id}"),
-            }
+        messages = response.get("Messages", [])
 
-        print(restaurant_details)
+        if not messages:
+            print("No messages in queue")
+            return {"statusCode": 200, "body": json.dumps("No messages to process")}
 
-        # Format and send email
-        send_email(
-            user_email, restaurant_details, location, dining_time, num_people, cuisine
+        failures = process_batch(
+            [(message["MessageId"], message["Body"]) for message in messages]
         )
+        processed = [message for message in messages if message["MessageId"] not in failures]
 
-        # Delete the message from the queue
-        sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
+        # Messages left on the queue are redelivered after the visibility timeout
+        delete_messages(processed)
 
         return {
             "statusCode": 200,
-            "body": json.dumps("Restaurant recommendation sent successfully"),
+            "body": json.dumps({
+                "processed": len(processed),
+                "failedMessageIds": failures,
+            }),
         }
         
     except Exception as e:
@@ -124,101 +293,567 @@ def lambda_handler(event, context):
             'body': json.dumps(f'Error processing message: {str(e)}')
         }
 
-def get_restaurants_from_opensearch(cuisine):
+def process_batch(messages):
+    """Process (message_id, body) pairs and return the IDs that should be retried."""
+    failures = []
+    emails = []
+    fingerprints = {}
+    finished = []
+
+    # Each message is handled on its own so one bad message does not fail the rest
+    results = executor.map(try_process_message, messages)
+
+    for (message_id, _), (ok, email, fingerprint) in zip(messages, results):
+        if not ok:
+            failures.append(message_id)
+        elif email:
+            emails.append((message_id, email))
+            fingerprints[message_id] = fingerprint
+        elif fingerprint:
+            finished.append(fingerprint)
+
+    # Recommendations go out together, a failed send is retried
+    failed_sends = send_emails(emails)
+
+    # The retry must not be mistaken for a duplicate
+    for message_id in failed_sends:
+        release_request(fingerprints[message_id])
+
+    failures.extend(failed_sends)
+
+    # Only now are the requests answered, until then their claims are leases
+    finished.extend(
+        fingerprint for message_id, fingerprint in fingerprints.items()
+        if message_id not in failed_sends
+    )
+    list(executor.map(complete_request, [fingerprint for fingerprint in finished if fingerprint]))
+
+    record("messages", len(messages), "Count")
+    record("failures", len(failures), "Count")
+    print(f"Restaurant cache: {restaurant_cache.stats()}")
+    print(f"Candidate cache: {candidate_cache.stats()}")
+    print(f"Recommendation cache: {recommendation_cache.stats()}")
+
+    return failures
+
+def try_process_message(message):
+    """Run process_message on a worker thread.
+
+    Returns (ok, email, fingerprint), fingerprint being the claim this
+    message holds, if any. Duplicates of a request already answered inside
+    the dedupe window are dropped before any lookups. A request another
+    worker is still processing is retried later.
+    """
+    message_id, body = message
+    fingerprint = None
+
+    # A body that does not parse can never succeed, so it is not retried
     try:
-        # Search for restaurants with the given cuisine
-        query = {
-            "query": {"match": {"Cuisine": cuisine}},
-            "size": 25,  # Get up to 25 restaurants to randomly choose from
-        }
+        message_body = json.loads(body)
+    except json.JSONDecodeError as e:
+        print(f"Dropping message {message_id}, body is not valid JSON: {str(e)}")
+        return True, None, None
 
-        response = opensearch_client.search(body=query, index="restaurants")
+    if not isinstance(message_body, dict):
+        print(f"Dropping message {message_id}, body is not a JSON object")
+        return True, None, None
 
-        print(response)
+    try:
+        request = request_fingerprint(message_body)
 
-        # Extract restaurant IDs from the response
-        restaurant_ids = [
-            hit["_source"]["RestaurantID"] for hit in response["hits"]["hits"]
-        ]
+        if request:
+            claim = claim_request(request)
 
-        print(restaurant_ids)
+            if claim == "done":
+                print(f"Skipping duplicate request in message {message_id}")
+                return True, None, None
 
-        return restaurant_ids
+            if claim == "in_progress":
+                print(f"Request in message {message_id} is being processed elsewhere, retrying later")
+                return False, None, None
+
+            fingerprint = request
+
+        # Written before the message can be deleted, so a failed write is
+        # retried with the message. Messages process_message drops have no
+        # search worth remembering.
+        if message_body.get("session_id") and request_fields(message_body):
+            store_last_search(message_body)
+
+        return True, process_message(message_body), fingerprint
 
     except Exception as e:
-        print(f"Error searching OpenSearch: {str(e)}")
-        return []
+        print(f"Error processing message {message_id}: {str(e)}")
+        release_request(fingerprint)
+        return False, None, fingerprint
+
+def request_fields(message_body):
+    """Return the request's fields with defaults filled in, or None when
+    cuisine or email is missing and the message can never succeed."""
+    if not message_body.get("cuisine") or not message_body.get("email"):
+        return None
 
+    return {
+        "email": message_body["email"],
+        "cuisine": message_body["cuisine"],
+        "location": message_body.get("location", "Manhattan"),
+        "dining_time": message_body.get("dining_time", "today"),
+        "num_people": message_body.get("num_people", "2"),
+    }
+
+def request_fingerprint(message_body):
+    """Stable hash of the fields that make two requests the same, or None."""
+    fields = request_fields(message_body)
+    if not fields:
+        return None
+
+    key = "|".join(str(field).strip().lower() for field in fields.values())
+
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def claim_request(fingerprint):
+    """Take an in-progress lease on a request.
+
+    Returns "claimed" when this worker should process it, "done" when it
+    was already answered, or "in_progress" when another worker holds an
+    unexpired lease on it.
+    """
+    # The claim's own expiry decides, the cache TTL only bounds memory
+    expires_at = seen_requests.get(fingerprint)
+    if expires_at is not None and expires_at >= time.time():
+        return "done"
+
+    now = int(time.time())
 
-def get_restaurant_from_dynamodb(restaurant_id):
     try:
-        table = dynamodb.Table("yelp-restaurants")
-        response = table.get_item(Key={"business_id": restaurant_id})
+        table = get_dynamodb().Table(IDEMPOTENCY_TABLE)
+        with timed("dynamodb.claim_request"):
+            table.put_item(
+                Item={
+                    "fingerprint": fingerprint,
+                    "status": "in_progress",
+                    "expires_at": now + CLAIM_LEASE_SECONDS,
+                },
+                # Expired leases and answers are free to take. DynamoDB TTL
+                # deletes lazily, so they can still be present.
+                ConditionExpression="attribute_not_exists(fingerprint) OR expires_at < :now",
+                ExpressionAttributeValues={":now": now},
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
 
-        if "Item" in response:
-            return response["Item"]
-        else:
-            return None
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            # The existing claim comes back in the low-level attribute format
+            item = e.response.get("Item", {})
+            status = item.get("status", {}).get("S", "done")
+            if status == "done" and "expires_at" in item:
+                seen_requests.put(fingerprint, int(item["expires_at"]["N"]))
+            return status
+
+        # Sending a duplicate is better than dropping a request
+        print(f"Error claiming request: {e.response['Error']['Message']}")
+
+    except Exception as e:
+        print(f"Error claiming request: {str(e)}")
+
+    return "claimed"
 
+def complete_request(fingerprint):
+    """Mark an answered request done for the rest of the dedupe window."""
+    expires_at = int(time.time()) + DEDUPE_WINDOW_SECONDS
+    seen_requests.put(fingerprint, expires_at)
+
+    try:
+        with timed("dynamodb.complete_request"):
+            get_dynamodb().Table(IDEMPOTENCY_TABLE).update_item(
+                Key={"fingerprint": fingerprint},
+                UpdateExpression="SET #status = :done, expires_at = :expires_at",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":done": "done",
+                    ":expires_at": expires_at,
+                },
+            )
     except Exception as e:
-        print(f"Error fetching from DynamoDB: {str(e)}")
+        # The email is out, at worst the lease expires and a duplicate is answered
+        print(f"Error completing request: {str(e)}")
+
+def release_request(fingerprint):
+    """Drop the claim on a request that failed so its retry is processed."""
+    if not fingerprint:
+        return
+
+    seen_requests.discard(fingerprint)
+
+    try:
+        get_dynamodb().Table(IDEMPOTENCY_TABLE).delete_item(Key={"fingerprint": fingerprint})
+    except Exception as e:
+        print(f"Error releasing request: {str(e)}")
+
+def store_last_search(message_body):
+    """Save a new search from LF1 as the user's last search.
+
+    Only called for messages that have the required fields, the rest get
+    the same defaults process_message uses.
+    """
+    with timed("dynamodb.put_item"):
+        get_dynamodb().Table(HISTORY_TABLE).put_item(
+            Item={
+                "session_id": message_body["session_id"],
+                **request_fields(message_body),
+                "timestamp": int(message_body.get("insertedAtTimestamp", time.time())),
+            }
+        )
+
+def process_message(message_body):
+    """Build the recommendation email for a single dining request.
+
+    Returns the email to send, or None when there is nothing to send and
+    the message is finished with (requests that can never succeed, or no
+    restaurant found). Service errors from the lookups are not caught, so
+    they raise and the message is retried.
+    """
+    debug(message_body)
+
+    # Extract required information from the message
+    fields = request_fields(message_body)
+
+    if not fields:
+        print("Missing required fields in message")
+        return None
+
+    cuisine = fields["cuisine"]
+    user_email = fields["email"]
+    location = fields["location"]
+    dining_time = fields["dining_time"]
+    num_people = fields["num_people"]
+
+    if RECOMMENDATION_SOURCE == "precomputed":
+        restaurant_details = pick_precomputed_restaurant(cuisine, location)
+    else:
+        restaurant_details = pick_searched_restaurant(cuisine, location)
+
+    if not restaurant_details:
         return None
 
+    debug(restaurant_details)
 
-def send_email(user_email, restaurant, location, dining_time, num_people, cuisine):
-    # Format the restaurant address
-    address = restaurant.get("address", {})
-
-    # Create email subject and body
-    subject = f"Your {cuisine} Restaurant Recommendation"
-
-    body_html = f"""
-    <html>
-    <head></head>
-    <body>
-        <h1>Your Restaurant Recommendation</h1>
-        <p>Hello!</p>
-        <p>Based on your request for {cuisine} cuisine in {location} for {num_people} people on {dining_time}, we recommend:</p>
-        <h2>{restaurant.get('name', 'Restaurant')}</h2>
-        <p><strong>Address:</strong> {address}</p>
-        <p><strong>Phone:</strong> {restaurant.get('phone', 'N/A')}</p>
-        <p><strong>Rating:</strong> {restaurant.get('rating', 'N/A')} stars</p>
-        <p><strong>Review Count:</strong> {restaurant.get('review_count', 'N/A')}</p>
-        <p><strong>Price:</strong> {restaurant.get('price', 'N/A')}</p>
-        <p>Enjoy your meal!</p>
-    </body>
-    </html>
+    return build_email(
+        user_email, restaurant_details, location, dining_time, num_people, cuisine
+    )
+
+def pick_searched_restaurant(cuisine, location):
+    if SEARCH_BACKEND == "local" and not centroid(location):
+        # Nothing to rank by distance, draw straight from the cuisine's alias table
+        restaurant_id = sample_from_local_index(cuisine)
+
+        if not restaurant_id:
+            print(f"No restaurants found for cuisine: {cuisine}")
+            return None
+
+        restaurant_details = get_restaurant_from_dynamodb(restaurant_id)
+
+        if not restaurant_details:
+            print(f"Restaurant details not found for ID: {restaurant_id}")
+
+        return restaurant_details
+
+    # Get candidate restaurants from the search backend
+    restaurants = search_restaurants(cuisine, location)
+
+    if not restaurants:
+        print(f"No restaurants found for cuisine: {cuisine}")
+        return None
+
+    # Load every candidate of this cuisine at once so later picks hit the cache
+    candidates = get_restaurants_from_dynamodb(restaurants)
+
+    # Select a restaurant, better rated and more reviewed ones more often
+    restaurant_id = weighted_choice(restaurants, candidates)
+
+    # Get detailed restaurant information from DynamoDB
+    restaurant_details = candidates.get(restaurant_id) or get_restaurant_from_dynamodb(restaurant_id)
+
+    if not restaurant_details:
+        print(f"Restaurant details not found for ID: {restaurant_id}")
+
+    return restaurant_details
+
+def pick_precomputed_restaurant(cuisine, location):
+    restaurants, sampler = get_precomputed_restaurants(cuisine, location)
+
+    # Records are written for the whole borough, neighbourhoods fall back to it
+    if not restaurants and location.strip().lower() != "manhattan":
+        restaurants, sampler = get_precomputed_restaurants(cuisine, "Manhattan")
+
+    if not restaurants:
+        print(f"No precomputed restaurants for cuisine: {cuisine} in {location}")
+        return None
+
+    return restaurants[sampler.draw()]
+
+def weighted_choice(restaurant_ids, restaurants):
+    """Pick one of a short candidate list weighted by rating and reviews.
+
+    restaurants maps IDs to their items, candidates without details get
+    no weight. Falls back to a uniform pick when nothing has a weight.
     """
+    weights = [
+        restaurant_weight(item.get("rating"), item.get("num_reviews")) if item else 0
+        for item in (restaurants.get(restaurant_id) for restaurant_id in restaurant_ids)
+    ]
+
+    if sum(weights) <= 0:
+        return random.choice(restaurant_ids)
+
+    return random.choices(restaurant_ids, weights=weights)[0]
+
+def delete_messages(messages):
+    """Remove handled messages from the queue with a single batch call."""
+    if not messages:
+        return
+
+    entries = [
+        {"Id": str(i), "ReceiptHandle": message["ReceiptHandle"]}
+        for i, message in enumerate(messages)
+    ]
+
+    with timed("sqs.delete_message_batch"):
+        response = get_sqs().delete_message_batch(QueueUrl=QUEUE_URL, Entries=entries)
+
+    for failed in response.get("Failed", []):
+        print(f"Error deleting message {failed['Id']}: {failed.get('Message')}")
+
+def search_restaurants(cuisine, location):
+    if SEARCH_BACKEND == "local":
+        return get_restaurants_from_local_index(cuisine, location)
+
+    return get_restaurants_from_opensearch(cuisine)
+
+# A snapshot that fails to load or download raises, so the message is
+# retried instead of answered as having no restaurants
+def sample_from_local_index(cuisine):
+    with timed("local_index.sample"):
+        return get_local_index().sample(cuisine)
+
+def get_restaurants_from_local_index(cuisine, location):
+    point = centroid(location)
+
+    if point:
+        with timed("local_index.nearby"):
+            return get_local_index().nearby(
+                cuisine, point[0], point[1], CANDIDATE_POOL_SIZE, KM_PER_STAR
+            )
+
+    with timed("local_index.search"):
+        return get_local_index().search(cuisine, CANDIDATE_POOL_SIZE)
+
+def get_restaurants_from_opensearch(cuisine):
+    cache_key = cuisine.lower()
+    restaurant_ids = candidate_cache.get(cache_key)
+    if restaurant_ids is not None:
+        return restaurant_ids
+
+    # Exact cuisine filter on the keyword field, nothing to score. Only
+    # the IDs are needed. Search errors propagate so the message is retried.
+    query = {
+        "query": {"bool": {"filter": [{"term": {"Cuisine": cache_key}}]}},
+        "size": CANDIDATE_POOL_SIZE,
+        "_source": ["RestaurantID"],
+    }
+
+    with timed("opensearch.search"):
+        # Hits are only served from the shard request cache when asked for
+        response = get_opensearch().search(
+            body=query, index="restaurants", request_cache=True
+        )
 
-    body_text = f"""
-    Your Restaurant Recommendation
-    
-    Hello!
-    
-    Based on your request for {cuisine} cuisine in {location} for {num_people} people on {dining_time}, we recommend:
-    
-    {restaurant.get('name', 'Restaurant')}
-    Address: {address}
-    Phone: {restaurant.get('phone', 'N/A')}
-    Rating: {restaurant.get('rating', 'N/A')} stars
-    Review Count: {restaurant.get('review_count', 'N/A')}
-    Price: {restaurant.get('price', 'N/A')}
-    
-    Enjoy your meal!
+    # Extract restaurant IDs from the response
+    restaurant_ids = [
+        hit["_source"]["RestaurantID"] for hit in response["hits"]["hits"]
+    ]
+
+    print(f"Found {len(restaurant_ids)} restaurants for cuisine: {cuisine}")
+
+    # Empty results are not cached so a newly indexed cuisine shows up right away
+    if restaurant_ids:
+        candidate_cache.put(cache_key, restaurant_ids)
+
+    return restaurant_ids
+
+
+def get_precomputed_restaurants(cuisine, location):
+    """Return (candidates, alias table) for a cuisine and location with one key lookup.
+
+    The alias table is built once when the record is cached, so every
+    later pick is a constant-time weighted draw.
     """
+    # Same key format as utils/precompute_recommendations.py
+    key = f"{cuisine.strip().lower()}#{location.strip().lower()}"
+
+    cached = recommendation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    table = get_dynamodb().Table(RECOMMENDATION_TABLE)
+    with timed("dynamodb.get_item"):
+        response = table.get_item(Key={"recommendation_key": key})
+
+    restaurants = response.get("Item", {}).get("restaurants", [])
+    sampler = AliasTable([
+        restaurant_weight(restaurant.get("rating"), restaurant.get("num_reviews"))
+        for restaurant in restaurants
+    ])
+
+    # Misses are cached too: neighbourhoods without their own record
+    # would otherwise read the table on every message
+    recommendation_cache.put(key, (restaurants, sampler))
+
+    return restaurants, sampler
+
+
+def get_restaurant_from_dynamodb(restaurant_id):
+    item = restaurant_cache.get(restaurant_id)
+    if item is not None:
+        return item
+
+    table = get_dynamodb().Table(RESTAURANT_TABLE)
+    with timed("dynamodb.get_item"):
+        response = table.get_item(Key={"business_id": restaurant_id})
+
+    if "Item" in response:
+        restaurant_cache.put(restaurant_id, response["Item"])
+        return response["Item"]
+    else:
+        return None
+
+
+def get_restaurants_from_dynamodb(restaurant_ids):
+    """Return {business_id: item} for the given IDs.
+
+    Cached items are served from memory; the rest are loaded with
+    batch_get_item (100 keys per request) and added to the cache. Errors
+    propagate so the message is retried rather than answered without details.
+    """
+    restaurants = {}
+    missing = []
+
+    for restaurant_id in dict.fromkeys(restaurant_ids):
+        item = restaurant_cache.get(restaurant_id)
+        if item is not None:
+            restaurants[restaurant_id] = item
+        else:
+            missing.append(restaurant_id)
+
+    for i in range(0, len(missing), 100):
+        request = {
+            RESTAURANT_TABLE: {
+                "Keys": [{"business_id": restaurant_id} for restaurant_id in missing[i:i + 100]]
+            }
+        }
+
+        # Throttled keys come back as UnprocessedKeys and are requested again
+        while request:
+            with timed("dynamodb.batch_get_item"):
+                response = get_dynamodb().batch_get_item(RequestItems=request)
+
+            for item in response.get("Responses", {}).get(RESTAURANT_TABLE, []):
+                restaurant_cache.put(item["business_id"], item)
+                restaurants[item["business_id"]] = item
+
+            request = response.get("UnprocessedKeys")
+
+    return restaurants
+
+
+def build_email(user_email, restaurant, location, dining_time, num_people, cuisine):
+    """Return the destination and template data for one recommendation."""
+    template_data = {
+        "cuisine": cuisine,
+        "location": location,
+        "num_people": num_people,
+        "dining_time": dining_time,
+        "name": restaurant.get("name", "Restaurant"),
+        "address": restaurant.get("address", {}),
+        "phone": restaurant.get("phone", "N/A"),
+        "rating": restaurant.get("rating", "N/A"),
+        "review_count": restaurant.get("review_count", "N/A"),
+        "price": restaurant.get("price", "N/A"),
+    }
+
+    return {
+        "Destination": {"ToAddresses": [user_email]},
+        # DynamoDB numbers come back as Decimal
+        "ReplacementTemplateData": json.dumps(template_data, default=str),
+    }
+
+
+def ensure_email_template():
+    """Make sure the recommendation template exists, checked once per container."""
+    global email_template_ready
+
+    if email_template_ready:
+        return
 
     try:
-        response = ses.send_email(
-            Source=FROM_EMAIL,
-            Destination={"ToAddresses": [user_email]},
-            Message={
-                "Subject": {"Data": subject},
-                "Body": {"Text": {"Data": body_text}, "Html": {"Data": body_html}},
-            },
-        )
-        print(f"Email sent! Message ID: {response['MessageId']}")
-        return True
+        get_ses().get_template(TemplateName=EMAIL_TEMPLATE)
 
     except ClientError as e:
-        print(f"Error sending email: {e.response['Error']['Message']}")
-        return False
\ No newline at end of file
+        if e.response["Error"]["Code"] != "TemplateDoesNotExist":
+            raise
+
+        try:
+            get_ses().create_template(Template={
+                "TemplateName": EMAIL_TEMPLATE,
+                "SubjectPart": EMAIL_SUBJECT,
+                "HtmlPart": EMAIL_HTML,
+                "TextPart": EMAIL_TEXT,
+            })
+        except ClientError as e:
+            # Another container created it first
+            if e.response["Error"]["Code"] != "AlreadyExists":
+                raise
+
+    email_template_ready = True
+
+
+def send_emails(emails):
+    """Send (message_id, email) pairs in bulk and return the IDs that failed."""
+    if not emails:
+        return []
+
+    try:
+        ensure_email_template()
+    except (ClientError, BotoCoreError) as e:
+        print(f"Error registering email template: {str(e)}")
+        return [message_id for message_id, _ in emails]
+
+    failures = []
+
+    for i in range(0, len(emails), MAX_BULK_DESTINATIONS):
+        chunk = emails[i:i + MAX_BULK_DESTINATIONS]
+
+        try:
+            with timed("ses.send_bulk_templated_email"):
+                response = get_ses().send_bulk_templated_email(
+                    Source=FROM_EMAIL,
+                    Template=EMAIL_TEMPLATE,
+                    DefaultTemplateData=json.dumps({}),
+                    Destinations=[email for _, email in chunk],
+                )
+        except (ClientError, BotoCoreError) as e:
+            # Network errors and timeouts fail the chunk like a rejected call
+            print(f"Error sending email: {str(e)}")
+            failures.extend(message_id for message_id, _ in chunk)
+            continue
+
+        # Statuses are returned in the same order as the destinations
+        for (message_id, _), status in zip(chunk, response["Status"]):
+            # Only accepted destinations get a message ID
+            if status.get("MessageId"):
+                print(f"Email sent! Message ID: {status['MessageId']}")
+            else:
+                print(f"Error sending email: {status.get('Error', status.get('Status'))}")
+                failures.append(message_id)
+
+    return failures
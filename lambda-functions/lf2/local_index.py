@@ -0,0 +1,172 @@
+import gzip
+import json
+import math
+from array import array
+from alias import AliasTable, restaurant_weight
+
+# NumPy is only needed for fast proximity ranking, the index works without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+
+# Written by utils/build_search_index.py. Catalog snapshots written by
+# utils/catalog_snapshot.py (.npz) load too.
+SNAPSHOT_VERSION = 1
+
+
+class RestaurantIndex:
+    """In-process replacement for the restaurants OpenSearch index.
+
+    Restaurants are stored column-wise: IDs in a list, numeric fields in
+    typed arrays, all sharing one row number. Each cuisine maps to the
+    rows that serve it, ranked once at load so a search only has to
+    filter and slice, and to an alias table for weighted draws.
+    """
+
+    def __init__(self, ids, cuisines, ratings, num_reviews, latitudes, longitudes):
+        self.ids = ids
+        self.ratings = array("d", ratings)
+        self.num_reviews = array("l", num_reviews)
+        self.latitudes = array("d", latitudes)
+        self.longitudes = array("d", longitudes)
+
+        if np is not None:
+            # Views over the arrays above, converted once for distance math
+            self._ratings_np = np.frombuffer(self.ratings, dtype=np.float64)
+            self._lat_radians = np.radians(np.frombuffer(self.latitudes, dtype=np.float64))
+            self._lon_radians = np.radians(np.frombuffer(self.longitudes, dtype=np.float64))
+
+        grouped = {}
+        for row, cuisine in enumerate(cuisines):
+            grouped.setdefault(cuisine.lower(), []).append(row)
+
+        # Best rated first, ties go to the restaurant with more reviews
+        self.by_cuisine = {
+            cuisine: array("l", sorted(
+                rows,
+                key=lambda row: (self.ratings[row], self.num_reviews[row]),
+                reverse=True,
+            ))
+            for cuisine, rows in grouped.items()
+        }
+
+        self.samplers = {
+            cuisine: AliasTable([
+                restaurant_weight(self.ratings[row], self.num_reviews[row]) for row in rows
+            ])
+            for cuisine, rows in self.by_cuisine.items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".npz"):
+            return cls.load_catalog(path)
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported search index snapshot version: {snapshot.get('version')}")
+
+        columns = snapshot["columns"]
+        return cls(
+            columns["business_id"],
+            columns["cuisine"],
+            columns["rating"],
+            columns["num_reviews"],
+            columns["latitude"],
+            columns["longitude"],
+        )
+
+    @classmethod
+    def load_catalog(cls, path):
+        """Build the index from a memory-mapped catalog snapshot (needs NumPy).
+
+        IDs stay in the mapped string table and are only decoded for the
+        restaurants a search returns.
+        """
+        from catalog import Catalog
+
+        catalog = Catalog.load(path)
+        return cls(
+            catalog.strings("business_id"),
+            catalog.categories("cuisine"),
+            catalog.numeric("rating"),
+            catalog.numeric("num_reviews"),
+            catalog.numeric("latitude"),
+            catalog.numeric("longitude"),
+        )
+
+    def rows(self, cuisine):
+        return self.by_cuisine.get(cuisine.lower(), array("l"))
+
+    def search(self, cuisine, size, min_rating=0.0):
+        """Return up to size restaurant IDs for a cuisine, best rated first."""
+        rows = self.rows(cuisine)
+
+        if min_rating:
+            # Rows are ranked by rating, so everything past the first miss fails too
+            count = 0
+            while count < len(rows) and self.ratings[rows[count]] >= min_rating:
+                count += 1
+            size = min(size, count)
+
+        return [self.ids[row] for row in rows[:size]]
+
+    def sample(self, cuisine):
+        """Draw one restaurant ID for a cuisine weighted by rating and reviews, in O(1)."""
+        rows = self.rows(cuisine)
+        if not rows:
+            return None
+
+        return self.ids[rows[self.samplers[cuisine.lower()].draw()]]
+
+    def nearby(self, cuisine, latitude, longitude, size, km_per_star=1.0):
+        """Return up to size restaurant IDs for a cuisine ranked by distance and rating.
+
+        The score is rating minus distance / km_per_star, so by default a
+        restaurant one kilometre further away needs one more star to rank
+        the same.
+        """
+        rows = self.rows(cuisine)
+        if not rows:
+            return []
+
+        if np is not None:
+            distances = self._distances_numpy(rows, latitude, longitude)
+            scores = self._ratings_np[np.frombuffer(rows, dtype=rows.typecode)] - distances / km_per_star
+            best = np.argsort(-scores, kind="stable")[:size]
+            return [self.ids[rows[i]] for i in best]
+
+        scored = [
+            (self.ratings[row] - self._distance(row, latitude, longitude) / km_per_star, row)
+            for row in rows
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [self.ids[row] for _, row in scored[:size]]
+
+    def _distances_numpy(self, rows, latitude, longitude):
+        """Haversine distances in km from one point to every row, vectorized."""
+        index = np.frombuffer(rows, dtype=rows.typecode)
+        lat = self._lat_radians[index]
+        lon = self._lon_radians[index]
+        lat0 = math.radians(latitude)
+        lon0 = math.radians(longitude)
+
+        a = np.sin((lat - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    def _distance(self, row, latitude, longitude):
+        lat = math.radians(self.latitudes[row])
+        lon = math.radians(self.longitudes[row])
+        lat0 = math.radians(latitude)
+        lon0 = math.radians(longitude)
+
+        a = math.sin((lat - lat0) / 2) ** 2 + math.cos(lat0) * math.cos(lat) * math.sin((lon - lon0) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+    def __len__(self):
+        return len(self.ids)
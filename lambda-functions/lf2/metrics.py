@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Each function is deployed on its own, so this module is copied into every
+# lambda directory. Keep the copies identical.
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "DiningConcierge")
+
+# Full events and service responses are only logged when asked for
+DEBUG_PAYLOADS = os.environ.get("DEBUG_PAYLOADS", "false").lower() == "true"
+
+_lock = threading.Lock()
+_pending = {}
+
+
+def debug(*values):
+    if DEBUG_PAYLOADS:
+        print(*values)
+
+
+def record(name, value, unit="Milliseconds"):
+    with _lock:
+        _pending.setdefault(name, (unit, []))[1].append(value)
+
+
+@contextmanager
+def timed(stage):
+    """Record how long the block takes under the given stage name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, (time.perf_counter() - start) * 1000)
+
+
+def flush(function_name):
+    """Print everything recorded since the last flush as one EMF line."""
+    global _pending
+
+    with _lock:
+        pending, _pending = _pending, {}
+
+    if not pending:
+        return
+
+    # CloudWatch Embedded Metric Format, values are sent as arrays
+    line = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [["Function"]],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (unit, _) in pending.items()],
+            }],
+        },
+        "Function": function_name,
+    }
+    for name, (_, values) in pending.items():
+        line[name] = [round(value, 2) for value in values[:100]]
+
+    print(json.dumps(line, separators=(",", ":")))
+
+
+def instrumented(function_name):
+    """Time the whole handler and flush its metrics when it returns."""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            try:
+                with timed("handler"):
+                    return handler(event, context)
+            finally:
+                flush(function_name)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,33 @@
+# Approximate centroids (latitude, longitude) of the areas LF1 accepts as a
+# location. Keep the names in step with SUPPORTED_LOCATIONS in lf1/utils.py.
+NEIGHBOURHOOD_CENTROIDS = {
+    # The whole borough: no point to rank distance from
+    "manhattan": None,
+    "midtown": (40.7549, -73.9840),
+    "upper east side": (40.7736, -73.9566),
+    "upper west side": (40.7870, -73.9754),
+    "harlem": (40.8116, -73.9465),
+    "east harlem": (40.7957, -73.9389),
+    "washington heights": (40.8417, -73.9394),
+    "inwood": (40.8677, -73.9212),
+    "hell's kitchen": (40.7638, -73.9918),
+    "chelsea": (40.7465, -74.0014),
+    "flatiron": (40.7411, -73.9897),
+    "gramercy": (40.7368, -73.9845),
+    "murray hill": (40.7479, -73.9757),
+    "kips bay": (40.7423, -73.9801),
+    "greenwich village": (40.7336, -74.0027),
+    "west village": (40.7358, -74.0036),
+    "east village": (40.7265, -73.9815),
+    "soho": (40.7233, -74.0030),
+    "nolita": (40.7230, -73.9949),
+    "little italy": (40.7191, -73.9973),
+    "lower east side": (40.7150, -73.9843),
+    "chinatown": (40.7158, -73.9970),
+    "tribeca": (40.7163, -74.0086),
+    "financial district": (40.7075, -74.0113),
+}
+
+
+def centroid(location):
+    return NEIGHBOURHOOD_CENTROIDS.get(location.strip().lower())
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import boto3
+from functools import lru_cache
+from metrics import instrumented, record, timed
+
+# Keeps the restaurants index in step with yelp-restaurants from its DynamoDB
+# stream (view type NEW_IMAGE or NEW_AND_OLD_IMAGES). INSERT and MODIFY
+# become upserts, REMOVE becomes a delete, and each batch is one bulk call.
+
+INDEX = os.environ.get("INDEX", "restaurants")
+
+
+@lru_cache(maxsize=None)
+def get_opensearch():
+    from opensearchpy import OpenSearch, RequestsHttpConnection
+    from requests_aws4auth import AWS4Auth
+
+    credentials = boto3.Session().get_credentials()
+    awsauth = AWS4Auth(
+        credentials.access_key,
+        credentials.secret_key,
+        os.environ['AWS_REGION'],
+        'es',
+        session_token=credentials.token
+    )
+
+    return OpenSearch(
+        hosts=[{'host': os.environ['OPENSEARCH_HOST'], 'port': 443}],
+        http_auth=awsauth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection,
+        timeout=int(os.environ.get("OPENSEARCH_TIMEOUT", "10")),
+    )
+
+
+@instrumented("lf3")
+def lambda_handler(event, context):
+    """Apply a batch of stream records to the index.
+
+    Requires ReportBatchItemFailures on the event source mapping. The
+    returned sequence number is the checkpoint: Lambda retries the shard
+    from that record on, and replaying records that already succeeded is
+    harmless because every operation is idempotent.
+    """
+    failed = sync_records(event["Records"], get_opensearch())
+
+    return {"batchItemFailures": [{"itemIdentifier": failed}] if failed else []}
+
+
+def document_action(record):
+    """Return the (action, id, source) a stream record maps to, or None."""
+    change = record["dynamodb"]
+    restaurant_id = change.get("Keys", {}).get("business_id", {}).get("S")
+
+    if not restaurant_id:
+        return None
+
+    if record["eventName"] == "REMOVE":
+        return "delete", restaurant_id, None
+
+    cuisine = change.get("NewImage", {}).get("cuisine", {}).get("S")
+
+    # Same rule as the full sync: restaurants without a cuisine are not indexed
+    if not cuisine:
+        return "delete", restaurant_id, None
+
+    return "index", restaurant_id, {"RestaurantID": restaurant_id, "Cuisine": cuisine}
+
+
+def sync_records(records, opensearch_client):
+    """Send the records as one bulk request.
+
+    Returns the sequence number of the first record whose change failed,
+    or None when everything was applied.
+    """
+    # Only the last change to each restaurant in the batch needs applying
+    latest = {}
+    for stream_record in records:
+        action = document_action(stream_record)
+        if action:
+            latest[action[1]] = (action, stream_record["dynamodb"]["SequenceNumber"])
+
+    if not latest:
+        return None
+
+    body = []
+    for (action, restaurant_id, source), _ in latest.values():
+        body.append({action: {"_index": INDEX, "_id": restaurant_id}})
+        if source is not None:
+            body.append(source)
+
+    with timed("opensearch.bulk"):
+        response = opensearch_client.bulk(body=body)
+
+    failed = []
+    for item, (_, sequence_number) in zip(response["items"], latest.values()):
+        (action, result), = item.items()
+
+        # Deleting a document that was never indexed is fine
+        if result.get("status", 500) >= 300 and not (action == "delete" and result.get("status") == 404):
+            print(f"Error applying {action} for {result.get('_id')}: {result.get('error')}")
+            failed.append(sequence_number)
+
+    record("changes_applied", len(latest) - len(failed), "Count")
+    record("changes_failed", len(failed), "Count")
+
+    indexed = sum(1 for (action, _, _), _ in latest.values() if action == "index")
+    print(
+        f"Applied {len(latest) - len(failed)} of {len(latest)} changes "
+        f"({indexed} upserts, {len(latest) - indexed} deletes) from {len(records)} records"
+    )
+
+    return min(failed, key=int) if failed else None
+
+
+class LocalIndex:
+    """In-memory stand-in for the restaurants index, enough for bulk."""
+
+    def __init__(self, documents=None):
+        self.documents = documents or {}
+
+    def bulk(self, body):
+        items = []
+        lines = iter(body)
+
+        for line in lines:
+            (action, meta), = line.items()
+
+            if action == "index":
+                self.documents[meta["_id"]] = next(lines)
+                items.append({"index": {"_id": meta["_id"], "status": 200}})
+            else:
+                status = 200 if self.documents.pop(meta["_id"], None) else 404
+                items.append({"delete": {"_id": meta["_id"], "status": status}})
+
+        return {"errors": False, "items": items}
+
+
+def replay(events_path, index_path, checkpoint_path):
+    """Apply a file of stream events to a JSON file index, resuming from a checkpoint.
+
+    The checkpoint maps each shard (eventSourceARN) to the last sequence
+    number applied, so rerunning with the same events file only applies
+    what is new.
+    """
+    def load(path):
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return {}
+
+    with open(events_path) as f:
+        events = json.load(f)
+
+    index = LocalIndex(load(index_path))
+    checkpoint = load(checkpoint_path)
+
+    for event in events if isinstance(events, list) else [events]:
+        records = [
+            stream_record for stream_record in event["Records"]
+            if int(stream_record["dynamodb"]["SequenceNumber"]) > int(checkpoint.get(stream_record.get("eventSourceARN", ""), -1))
+        ]
+
+        failed = sync_records(records, index)
+
+        for stream_record in records:
+            sequence_number = stream_record["dynamodb"]["SequenceNumber"]
+            if failed is not None and int(sequence_number) >= int(failed):
+                break
+            checkpoint[stream_record.get("eventSourceARN", "")] = sequence_number
+
+    with open(index_path, "w") as f:
+        json.dump(index.documents, f, indent=2)
+
+    with open(checkpoint_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+
+    print(f"{len(index.documents)} documents in {index_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay DynamoDB stream events against a local index.")
+    parser.add_argument("events", help="JSON file with one stream event or a list of them")
+    parser.add_argument("--index", default="local_index.json")
+    parser.add_argument("--checkpoint", default="checkpoint.json")
+    args = parser.parse_args()
+
+    replay(args.events, args.index, args.checkpoint)
@@ -0,0 +1,52 @@
+import gzip
+import json
+import sys
+from precompute_recommendations import scan_restaurants
+
+# Read by lambda-functions/lf2/local_index.py, bump both together
+SNAPSHOT_VERSION = 1
+
+OUTPUT_PATH = "restaurants_index.json.gz"
+
+
+def build_snapshot(restaurants):
+    """Lay the catalog out column-wise, one row per restaurant."""
+    columns = {
+        "business_id": [],
+        "cuisine": [],
+        "rating": [],
+        "num_reviews": [],
+        "latitude": [],
+        "longitude": [],
+    }
+
+    for restaurant in restaurants:
+        if not restaurant.get("business_id") or not restaurant.get("cuisine"):
+            continue
+
+        coordinates = restaurant.get("coordinates") or {}
+
+        columns["business_id"].append(restaurant["business_id"])
+        columns["cuisine"].append(restaurant["cuisine"])
+        columns["rating"].append(float(restaurant.get("rating") or 0))
+        columns["num_reviews"].append(int(restaurant.get("num_reviews") or 0))
+        columns["latitude"].append(float(coordinates.get("latitude") or 0))
+        columns["longitude"].append(float(coordinates.get("longitude") or 0))
+
+    return {"version": SNAPSHOT_VERSION, "columns": columns}
+
+
+def write_snapshot(snapshot, path):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    # Copy the file into lambda-functions/lf2 to bundle it, or upload it and
+    # point SEARCH_INDEX_S3_URI at it
+    path = sys.argv[1] if len(sys.argv) > 1 else OUTPUT_PATH
+
+    snapshot = build_snapshot(scan_restaurants())
+    write_snapshot(snapshot, path)
+
+    print(f"Wrote {len(snapshot['columns']['business_id'])} restaurants to {path}.")
@@ -0,0 +1,100 @@
+import mmap
+import struct
+import zipfile
+import numpy as np
+
+# Written by utils/catalog_snapshot.py. A copy of this file lives in
+# lambda-functions/lf2, keep the two in step.
+CATALOG_VERSION = 1
+
+
+def map_npz(path):
+    """Return every array in an uncompressed .npz as a view over one read-only mmap.
+
+    np.load ignores mmap_mode for .npz files and copies each member, so the
+    zip entries are located by hand and wrapped with np.frombuffer.
+    """
+    arrays = {}
+
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        with zipfile.ZipFile(f) as archive:
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{info.filename} is compressed and cannot be memory-mapped")
+
+                # The local header is 30 bytes plus its own name and extra field
+                name_length, extra_length = struct.unpack(
+                    "<HH", buffer[info.header_offset + 26:info.header_offset + 30]
+                )
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+                count = int(np.prod(shape))
+                array = np.frombuffer(buffer, dtype=dtype, count=count, offset=f.tell())
+                arrays[info.filename[:-len(".npy")]] = array.reshape(
+                    shape, order="F" if fortran_order else "C"
+                )
+
+    return arrays
+
+
+class StringColumn:
+    """Strings stored as one UTF-8 blob plus n + 1 offsets, decoded on access."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+class Catalog:
+    """Column-wise view of the restaurant catalog, backed by a memory-mapped file.
+
+    Numeric columns are NumPy arrays. Free-text columns are StringColumns.
+    Low-cardinality columns such as cuisine are stored as integer codes
+    into a small vocabulary.
+    """
+
+    def __init__(self, arrays):
+        version = int(arrays["version"][0])
+        if version != CATALOG_VERSION:
+            raise ValueError(f"Unsupported catalog snapshot version: {version}")
+
+        self.arrays = arrays
+
+    @classmethod
+    def load(cls, path):
+        return cls(map_npz(path))
+
+    def numeric(self, name):
+        return self.arrays[name]
+
+    def strings(self, name):
+        return StringColumn(self.arrays[f"{name}.offsets"], self.arrays[f"{name}.data"])
+
+    def codes(self, name):
+        """Return (codes, vocabulary) of a dictionary-encoded column."""
+        vocabulary = list(StringColumn(self.arrays[f"{name}.vocab.offsets"], self.arrays[f"{name}.vocab.data"]))
+        return self.arrays[f"{name}.codes"], vocabulary
+
+    def categories(self, name):
+        codes, vocabulary = self.codes(name)
+        return [vocabulary[code] for code in codes]
+
+    def __len__(self):
+        return len(self.arrays["business_id.offsets"]) - 1
@@ -0,0 +1,92 @@
+import argparse
+import time
+from collections import Counter
+import numpy as np
+from catalog import CATALOG_VERSION, Catalog
+from precompute_recommendations import scan_restaurants
+
+OUTPUT_PATH = "restaurants_catalog.npz"
+
+NUMERIC_COLUMNS = {
+    "rating": np.float64,
+    "num_reviews": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+}
+STRING_COLUMNS = ["business_id", "name", "address", "zip_code", "inserted_at_timestamp"]
+# Few distinct values, stored as codes into a vocabulary
+CATEGORY_COLUMNS = ["cuisine"]
+
+
+def encode_strings(values):
+    """Pack strings into (offsets, data): string i is data[offsets[i]:offsets[i + 1]]."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def build_arrays(restaurants):
+    rows = {name: [] for name in [*NUMERIC_COLUMNS, *STRING_COLUMNS, *CATEGORY_COLUMNS]}
+
+    for restaurant in restaurants:
+        if not restaurant.get("business_id") or not restaurant.get("cuisine"):
+            continue
+
+        coordinates = restaurant.get("coordinates") or {}
+        values = dict(restaurant, latitude=coordinates.get("latitude"), longitude=coordinates.get("longitude"))
+
+        for name in NUMERIC_COLUMNS:
+            rows[name].append(values.get(name) or 0)
+        for name in [*STRING_COLUMNS, *CATEGORY_COLUMNS]:
+            rows[name].append(str(values.get(name) or ""))
+
+    arrays = {"version": np.array([CATALOG_VERSION], dtype=np.int64)}
+
+    for name, dtype in NUMERIC_COLUMNS.items():
+        arrays[name] = np.array([float(value) for value in rows[name]], dtype=dtype)
+
+    for name in STRING_COLUMNS:
+        arrays[f"{name}.offsets"], arrays[f"{name}.data"] = encode_strings(rows[name])
+
+    for name in CATEGORY_COLUMNS:
+        vocabulary = sorted(set(rows[name]))
+        code_of = {value: code for code, value in enumerate(vocabulary)}
+        arrays[f"{name}.codes"] = np.array([code_of[value] for value in rows[name]], dtype=np.int32)
+        arrays[f"{name}.vocab.offsets"], arrays[f"{name}.vocab.data"] = encode_strings(vocabulary)
+
+    return arrays
+
+
+def export(path):
+    arrays = build_arrays(scan_restaurants())
+
+    # Uncompressed, so every member can be memory-mapped in place
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+    print(f"Wrote {len(arrays['business_id.offsets']) - 1} restaurants to {path}.")
+
+
+def info(path):
+    start = time.perf_counter()
+    catalog = Catalog.load(path)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(f"Mapped {len(catalog)} restaurants from {path} in {elapsed:.1f} ms.")
+
+    codes, vocabulary = catalog.codes("cuisine")
+    for code, count in sorted(Counter(codes.tolist()).items()):
+        print(f"  {vocabulary[code]}: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export yelp-restaurants to a memory-mappable columnar snapshot.")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("path", nargs="?", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.path)
+    else:
+        info(args.path)
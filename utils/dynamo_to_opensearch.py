@@ -1,88 +1,211 @@
+import argparse
+import queue
+import threading
+import time
 import boto3
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-from requests_aws4auth import AWS4Auth
-import json
+from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth, helpers
 
 # Set up AWS credentials and region
 region = "us-east-1"  # Your region
 service = "es"
 
-# Get credentials
-credentials = boto3.Session(profile_name="default").get_credentials()
-
-print(credentials.access_key)
-print(credentials.secret_key)
-
-# awsauth = AWS4Auth(
-#     credentials.access_key,
-#     credentials.secret_key,
-#     region,
-#     service,
-#     session_token=credentials.token,
-# )
-
-awsauth = AWSV4SignerAuth(credentials, region, service)
-
 # OpenSearch endpoint - replace with your endpoint
 host = "search-restaurants-qybycszp3udr7u2iioq7aekp3e.us-east-1.es.amazonaws.com"  # Your domain endpoint
 
-# Create OpenSearch client
-opensearch_client = OpenSearch(
-    hosts=[{"host": host, "port": 443}],
-    http_auth=awsauth,
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection,
-)
+INDEX = "restaurants"
+TABLE = "yelp-restaurants"
+
+# Sentinel a scan worker puts on the queue when its segment is done
+SEGMENT_DONE = object()
+
+
+def create_client(thread_count):
+    # Get credentials
+    credentials = boto3.Session(profile_name="default").get_credentials()
+    awsauth = AWSV4SignerAuth(credentials, region, service)
+
+    # Create OpenSearch client, one pooled connection per bulk thread
+    return OpenSearch(
+        hosts=[{"host": host, "port": 443}],
+        http_auth=awsauth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection,
+        pool_maxsize=thread_count,
+        timeout=60,
+    )
+
+
+# A few thousand small documents: one shard is plenty, and one replica
+# keeps the index searchable if a node goes away
+INDEX_DEFINITION = {
+    "settings": {
+        "index": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            # Changes only come from the syncs, new documents can wait a little
+            "refresh_interval": "30s",
+            "requests": {"cache": {"enable": True}},
+        },
+        "analysis": {
+            "normalizer": {
+                "lowercase": {"type": "custom", "filter": ["lowercase"]}
+            }
+        },
+    },
+    "mappings": {
+        # Exact-match fields only, nothing here needs full-text analysis
+        "dynamic": "strict",
+        "properties": {
+            "RestaurantID": {"type": "keyword"},
+            "Cuisine": {"type": "keyword", "normalizer": "lowercase"},
+        },
+    },
+}
+
+
+def ensure_index(opensearch_client, recreate=False):
+    if recreate and opensearch_client.indices.exists(index=INDEX):
+        opensearch_client.indices.delete(index=INDEX)
+        print(f"Index deleted: {INDEX}")
+
+    # Create index if it doesn't exist
+    if not opensearch_client.indices.exists(index=INDEX):
+        response = opensearch_client.indices.create(index=INDEX, body=INDEX_DEFINITION)
+
+        print(f"Index created: {response}")
+        return
+
+    # Field types cannot change in place, an old index has to be rebuilt
+    mapping = opensearch_client.indices.get_mapping(index=INDEX)[INDEX]["mappings"]
+    if mapping.get("properties") != INDEX_DEFINITION["mappings"]["properties"]:
+        raise SystemExit(
+            f"Index {INDEX} has an outdated mapping {mapping.get('properties')}, rerun with --recreate"
+        )
+
+
+def scan_segment(segment, total_segments, pages):
+    """Scan one segment of the table, following LastEvaluatedKey to the end."""
+    # Sessions are not thread-safe, so every worker builds its own
+    table = boto3.session.Session().resource("dynamodb", region_name=region).Table(TABLE)
+    kwargs = {"Segment": segment, "TotalSegments": total_segments}
 
-opensearch_client.info()
-
-
-# Create index if it doesn't exist
-if not opensearch_client.indices.exists(index="restaurants"):
-    # Create index with mapping
-    index_body = {
-        "mappings": {
-            "properties": {"id": {"type": "keyword"}, "cuisine": {"type": "keyword"}}
-        }
-    }
+    try:
+        while True:
+            response = table.scan(**kwargs)
+            pages.put(response.get("Items", []))
 
-    response = opensearch_client.indices.create(index="restaurants", body=index_body)
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
-    print(f"Index created: {response}")
+    except Exception as e:
+        # Handed to the consumer so a failed segment stops the sync
+        pages.put(e)
 
+    pages.put(SEGMENT_DONE)
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table("yelp-restaurants")
 
+def scan_restaurants(total_segments):
+    """Yield every restaurant while the segments are scanned in parallel."""
+    # Bounded so scanning cannot run far ahead of indexing
+    pages = queue.Queue(maxsize=total_segments * 2)
 
-# Scan DynamoDB Table (Fetch all records)
-response = table.scan()
-restaurants = response.get("Items", [])
+    for segment in range(total_segments):
+        threading.Thread(
+            target=scan_segment, args=(segment, total_segments, pages), daemon=True
+        ).start()
 
-for restaurant in restaurants:
-    try:
-        # Extract only required fields
+    remaining = total_segments
+    while remaining:
+        page = pages.get()
+        if page is SEGMENT_DONE:
+            remaining -= 1
+        elif isinstance(page, Exception):
+            raise page
+        else:
+            yield from page
 
-        print(restaurant)
 
+def index_actions(restaurants, skipped):
+    for restaurant in restaurants:
         restaurant_id = restaurant.get("business_id")
         cuisine = restaurant.get("cuisine")
 
-        print(restaurant_id, cuisine)
-
         if not restaurant_id or not cuisine:
-            continue  # Skip if data is incomplete
+            skipped.append(restaurant)  # Skip if data is incomplete
+            continue
 
-        # Prepare document for OpenSearch
-        document = {"RestaurantID": restaurant_id, "Cuisine": cuisine}
+        yield {
+            "_index": INDEX,
+            "_id": restaurant_id,
+            "_source": {"RestaurantID": restaurant_id, "Cuisine": cuisine},
+        }
 
-        # Index the document in OpenSearch
-        opensearch_client.index(index="restaurants", id=restaurant_id, body=document)
 
-    except Exception as e:
-        print(f"Error processing {restaurant}: {str(e)}")
+def sync(opensearch_client, total_segments, chunk_size, thread_count, progress_every):
+    settings = opensearch_client.indices.get_settings(index=INDEX)
+    # None when never set, which puts the default back afterwards
+    refresh_interval = settings[INDEX]["settings"]["index"].get("refresh_interval")
+
+    # No refreshes while loading, the index is refreshed once at the end
+    opensearch_client.indices.put_settings(
+        index=INDEX, body={"index": {"refresh_interval": "-1"}}
+    )
 
+    indexed = 0
+    failed = 0
+    skipped = []
+    start = time.perf_counter()
 
-print("Done!")
+    try:
+        results = helpers.parallel_bulk(
+            opensearch_client,
+            index_actions(scan_restaurants(total_segments), skipped),
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+        )
+
+        for ok, info in results:
+            if ok:
+                indexed += 1
+            else:
+                failed += 1
+                print(f"Error indexing {info}")
+
+            done = indexed + failed
+            if done % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{done} documents, {done / elapsed:.0f} docs/s")
+
+    finally:
+        opensearch_client.indices.put_settings(
+            index=INDEX, body={"index": {"refresh_interval": refresh_interval}}
+        )
+        opensearch_client.indices.refresh(index=INDEX)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Indexed {indexed} restaurants in {elapsed:.1f}s "
+        f"({indexed / max(elapsed, 1e-9):.0f} docs/s), "
+        f"{failed} failed, {len(skipped)} skipped as incomplete."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy yelp-restaurants into the restaurants index.")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    parser.add_argument("--chunk-size", type=int, default=500, help="documents per bulk request")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent bulk requests")
+    parser.add_argument("--progress-every", type=int, default=1000)
+    parser.add_argument("--recreate", action="store_true", help="delete and recreate the index first")
+    args = parser.parse_args()
+
+    opensearch_client = create_client(args.threads)
+    opensearch_client.info()
+
+    ensure_index(opensearch_client, args.recreate)
+    sync(opensearch_client, args.segments, args.chunk_size, args.threads, args.progress_every)
+
+    print("Done!")
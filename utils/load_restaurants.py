@@ -1,30 +1,21 @@
+import argparse
+import hashlib
+import json
+import queue
+import threading
 import boto3
-from decimal import Decimal
-from utils import get_restaurants
+from utils import crawl_stream
 
+REGION = "us-east-1"
+TABLE = "yelp-restaurants"
 
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-table = dynamodb.Table("yelp-restaurants")
+# Hash of everything but the load time, stored on each item so a refresh
+# can tell which restaurants actually changed
+HASH_ATTRIBUTE = "content_hash"
 
+# Sentinel that tells a writer thread there is nothing more to write
+WRITES_DONE = object()
 
-def convert_floats_to_decimals(data):
-    if isinstance(data, dict):
-        return {k: convert_floats_to_decimals(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convert_floats_to_decimals(v) for v in data]
-    elif isinstance(data, float):
-        return Decimal(str(data))
-    return data
-
-
-def store_in_dynamodb(restaurants):
-    with table.batch_writer() as batch:
-        for restaurant in restaurants:
-            restaurant_data = convert_floats_to_decimals(restaurant)
-            batch.put_item(Item=restaurant_data)
-
-
-# Example usage
 cuisines = [
     "Italian",
     "Mexican",
@@ -36,17 +27,129 @@ cuisines = [
     "Continental",
     "Korean",
     "French",
-    "Continental",
     "American",
 ]
 
 
-for cuisine in cuisines:
-    data = get_restaurants(cuisine=cuisine, location="Manhattan")
+def content_hash(restaurant):
+    content = {k: v for k, v in restaurant.items() if k not in ("inserted_at_timestamp", HASH_ATTRIBUTE)}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def stored_restaurants(table):
+    """Map every business_id in the table to its stored (content hash, cuisine)."""
+    stored = {}
+    kwargs = {
+        "ProjectionExpression": "business_id, cuisine, #hash",
+        "ExpressionAttributeNames": {"#hash": HASH_ATTRIBUTE},
+    }
+
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get("Items", []):
+            stored[item["business_id"]] = (item.get(HASH_ATTRIBUTE), item.get("cuisine"))
+
+        if "LastEvaluatedKey" not in response:
+            return stored
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def changed_restaurants(restaurants, stored, stats):
+    """Yield only the restaurants whose content differs from what is stored.
+
+    A restaurant keeps the cuisine it was first stored under, even when
+    another cuisine's search returns it first, so each one is decided on
+    arrival and written at most once.
+    """
+    seen = set()
+
+    for restaurant in restaurants:
+        stats["crawled"] += 1
+        business_id = restaurant["business_id"]
+
+        if business_id in seen:
+            continue
+        seen.add(business_id)
+
+        stored_hash, stored_cuisine = stored.get(business_id, (None, None))
+        if stored_cuisine:
+            restaurant["cuisine"] = stored_cuisine
+
+        restaurant[HASH_ATTRIBUTE] = content_hash(restaurant)
+        if restaurant[HASH_ATTRIBUTE] == stored_hash:
+            stats["unchanged"] += 1
+            continue
+
+        yield restaurant
+
+
+def write_restaurants(items, stats):
+    # Sessions are not thread-safe, so every writer builds its own
+    table = boto3.session.Session().resource("dynamodb", region_name=REGION).Table(TABLE)
+
+    try:
+        with table.batch_writer() as batch:
+            while True:
+                restaurant = items.get()
+                if restaurant is WRITES_DONE:
+                    return
+
+                batch.put_item(Item=restaurant)
+                stats["written"] += 1
+
+    except Exception as e:
+        stats["error"] = e
+
+        # Keep draining so the crawl is never stuck on a full queue
+        while items.get() is not WRITES_DONE:
+            pass
+
+
+def store_in_dynamodb(restaurants, writer_count):
+    """Stream restaurants into DynamoDB through writer_count parallel batch writers."""
+    # Bounded so crawling cannot run far ahead of writing
+    items = queue.Queue(maxsize=1000)
+    writer_stats = [{"written": 0} for _ in range(writer_count)]
+    writers = [
+        threading.Thread(target=write_restaurants, args=(items, stats), daemon=True)
+        for stats in writer_stats
+    ]
+    for writer in writers:
+        writer.start()
+
+    try:
+        for restaurant in restaurants:
+            items.put(restaurant)
+    finally:
+        for _ in writers:
+            items.put(WRITES_DONE)
+        for writer in writers:
+            writer.join()
+
+    for stats in writer_stats:
+        if "error" in stats:
+            raise stats["error"]
+
+    return sum(stats["written"] for stats in writer_stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl Yelp and load changed restaurants into yelp-restaurants.")
+    parser.add_argument("--location", default="Manhattan")
+    parser.add_argument("--writers", type=int, default=4, help="parallel batch writers")
+    args = parser.parse_args()
 
-    # print(data)
+    table = boto3.resource("dynamodb", region_name=REGION).Table(TABLE)
+    stored = stored_restaurants(table)
 
-    store_in_dynamodb(data)
-    print(f"Stored {len(data)} {cuisine} restaurants in DynamoDB.")
+    # Crawling, change detection and writing all overlap
+    stats = {"crawled": 0, "unchanged": 0}
+    written = store_in_dynamodb(
+        changed_restaurants(crawl_stream(cuisines, location=args.location), stored, stats),
+        args.writers,
+    )
 
-    # break
+    print(
+        f"Crawled {stats['crawled']} restaurants, stored {written} in DynamoDB, "
+        f"skipped {stats['unchanged']} unchanged."
+    )
@@ -0,0 +1,68 @@
+import boto3
+import random
+from collections import defaultdict
+
+
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+restaurants_table = dynamodb.Table("yelp-restaurants")
+recommendations_table = dynamodb.Table("restaurant-recommendations")
+
+# Every restaurant in yelp-restaurants was crawled for this area
+LOCATION = "Manhattan"
+
+# Keeps each record well below the 400 KB DynamoDB item limit
+MAX_CANDIDATES = 100
+
+# Everything LF2 needs to send the email, so it never has to read the catalog
+FIELDS = ["business_id", "name", "address", "rating", "num_reviews", "zip_code", "coordinates"]
+
+
+def recommendation_key(cuisine, location):
+    return f"{cuisine.strip().lower()}#{location.strip().lower()}"
+
+
+def scan_restaurants():
+    """Yield every restaurant, following LastEvaluatedKey across pages."""
+    kwargs = {}
+
+    while True:
+        response = restaurants_table.scan(**kwargs)
+        yield from response.get("Items", [])
+
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def build_recommendations(restaurants):
+    """Group restaurants into shuffled candidate lists per cuisine and location."""
+    groups = defaultdict(list)
+
+    for restaurant in restaurants:
+        cuisine = restaurant.get("cuisine")
+        if not restaurant.get("business_id") or not cuisine:
+            continue
+
+        candidate = {field: restaurant[field] for field in FIELDS if field in restaurant}
+        groups[recommendation_key(cuisine, LOCATION)].append(candidate)
+
+    for candidates in groups.values():
+        random.shuffle(candidates)
+
+    return {key: candidates[:MAX_CANDIDATES] for key, candidates in groups.items()}
+
+
+def store_recommendations(recommendations):
+    with recommendations_table.batch_writer() as batch:
+        for key, candidates in recommendations.items():
+            batch.put_item(
+                Item={"recommendation_key": key, "restaurants": candidates}
+            )
+
+
+if __name__ == "__main__":
+    recommendations = build_recommendations(scan_restaurants())
+    store_recommendations(recommendations)
+
+    for key, candidates in sorted(recommendations.items()):
+        print(f"Stored {len(candidates)} candidates for {key}.")
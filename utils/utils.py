@@ -1,9 +1,16 @@
+import hashlib
+import json
 import os
+import random
 import requests
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 from decimal import Decimal
-from typing import Dict, List
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, List
+from requests.adapters import HTTPAdapter
 import logging
 
 load_dotenv()
@@ -12,60 +19,233 @@ API_KEY = os.getenv("YELP_API_KEY")
 HEADERS = {"Authorization": f"Bearer {API_KEY}"}
 SEARCH_URL = "https://api.yelp.com/v3/businesses/search"
 
+PAGE_SIZE = 50  # Yelp max is 50
+
+# Requests per second the crawler may make, keep it under the Yelp QPS quota
+YELP_QPS = float(os.getenv("YELP_QPS", "5"))
+MAX_WORKERS = int(os.getenv("YELP_MAX_WORKERS", "8"))
+MAX_RETRIES = 5
+
+# Raw search responses are cached on disk, see fetch_page
+CACHE_DIR = os.getenv("YELP_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".yelp_cache"))
+CACHE_TTL_SECONDS = int(os.getenv("YELP_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Serve every page from the cache whatever its age and never call Yelp
+OFFLINE = os.getenv("YELP_OFFLINE", "false").lower() == "true"
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, in bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+rate_limiter = TokenBucket(YELP_QPS)
+
+
+def create_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    # One connection per worker, reused across pages
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+session = create_session()
+
+
+def cache_path(params: Dict) -> str:
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def read_cache(params: Dict):
+    try:
+        with open(cache_path(params)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not OFFLINE and time.time() - entry["fetched_at"] > CACHE_TTL_SECONDS:
+        return None
+
+    return entry["response"]
+
+
+def write_cache(params: Dict, response: Dict):
+    path = cache_path(params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Written aside and renamed so a reader never sees half a file
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"params": params, "fetched_at": time.time(), "response": response}, f)
+    os.replace(temp_path, path)
+
+
+def fetch_page(term: str, location: str, offset: int, limit: int) -> Dict:
+    """Fetch one page of search results, from the disk cache when it is fresh."""
+    params = {"term": term, "location": location, "limit": limit, "offset": offset}
+
+    response = read_cache(params)
+    if response is not None:
+        return response
+
+    if OFFLINE:
+        raise LookupError(f"No cached response for {params} and YELP_OFFLINE is set")
+
+    response = request_page(params)
+    if "businesses" in response:
+        write_cache(params, response)
+    return response
 
-def get_restaurants(cuisine: str, location: str, limit: int = 240) -> List[Dict]:
-    restaurants = []
-    total = 0
-    offset = 0
 
-    while len(restaurants) < limit:
+def retry_delay(retry_after, attempt: int) -> float:
+    """Seconds to wait before a retry.
+
+    Honours Retry-After in either form, delay-seconds or an HTTP date,
+    otherwise exponential backoff with jitter.
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+
         try:
-            params = {
-                "term": f"{cuisine} restaurants",
-                "location": location,
-                "limit": min(50, limit - len(restaurants)),  # Yelp max is 50
-                "offset": offset,
-            }
-
-            response = requests.get(SEARCH_URL, headers=HEADERS, params=params)
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    return 2 ** attempt + random.random()
+
+
+def request_page(params: Dict) -> Dict:
+    """Call the search API, backing off on 429, server errors and network errors."""
+    term, offset = params["term"], params["offset"]
+
+    for attempt in range(MAX_RETRIES):
+        last_attempt = attempt == MAX_RETRIES - 1
+        rate_limiter.acquire()
+
+        try:
+            response = session.get(SEARCH_URL, params=params, timeout=10)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                raise
+
+            delay = retry_delay(None, attempt)
+            logging.warning(f"Error requesting {term} offset {offset}: {e}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code != 429 and response.status_code < 500 or last_attempt:
             response.raise_for_status()
-            data = response.json()
-
-            if "businesses" not in data:
-                logging.error(f"No businesses found: {data}")
-                break
-
-            businesses = data["businesses"]
-            if not businesses:
-                break
-
-            for business in businesses:
-                if business["id"] not in {r["business_id"] for r in restaurants}:
-                    restaurant = {
-                        "business_id": business["id"],
-                        "name": business["name"],
-                        "address": " ".join(business["location"]["display_address"]),
-                        "coordinates": {
-                            "latitude": Decimal(
-                                str(business["coordinates"]["latitude"])
-                            ),
-                            "longitude": Decimal(
-                                str(business["coordinates"]["longitude"])
-                            ),
-                        },
-                        "num_reviews": business["review_count"],
-                        "rating": Decimal(str(business["rating"])),
-                        "zip_code": business["location"].get("zip_code", "N/A"),
-                        "inserted_at_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "cuisine": cuisine,
-                    }
-                    restaurants.append(restaurant)
-
-            offset += len(businesses)
-            time.sleep(0.25)  # Rate limiting protection
+            return response.json()
+
+        delay = retry_delay(response.headers.get("Retry-After"), attempt)
+        logging.warning(f"Yelp returned {response.status_code} for {term} offset {offset}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def to_restaurant(business: Dict, cuisine: str) -> Dict:
+    return {
+        "business_id": business["id"],
+        "name": business["name"],
+        "address": " ".join(business["location"]["display_address"]),
+        "coordinates": {
+            "latitude": Decimal(
+                str(business["coordinates"]["latitude"])
+            ),
+            "longitude": Decimal(
+                str(business["coordinates"]["longitude"])
+            ),
+        },
+        "num_reviews": business["review_count"],
+        "rating": Decimal(str(business["rating"])),
+        "zip_code": business["location"].get("zip_code", "N/A"),
+        "inserted_at_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "cuisine": cuisine,
+    }
+
 
+def crawl_stream(cuisines: Iterable[str], location: str, limit: int = 240, max_workers: int = MAX_WORKERS) -> Iterator[Dict]:
+    """Yield up to limit restaurants for every cuisine as their pages arrive.
+
+    All pages are fetched in parallel. A cuisine's later offsets are queued
+    as soon as its first page gives the result total. The shared token
+    bucket keeps the total request rate within the quota.
+    """
+    def fetch(cuisine, offset):
+        try:
+            data = fetch_page(f"{cuisine} restaurants", location, offset, min(PAGE_SIZE, limit - offset))
         except Exception as e:
             logging.error(f"Error fetching restaurants: {e}")
-            break
+            return None
+
+        if "businesses" not in data:
+            logging.error(f"No businesses found: {data}")
+            return None
+
+        return data["businesses"], data.get("total", 0)
+
+    seen = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(fetch, cuisine, 0): (cuisine, 0)
+            for cuisine in dict.fromkeys(cuisines)
+        }
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                cuisine, offset = pending.pop(future)
+                page = future.result()
+                if not page:
+                    continue
 
-    return restaurants
+                businesses, total = page
+                if offset == 0:
+                    for later in range(PAGE_SIZE, min(limit, total), PAGE_SIZE):
+                        pending[executor.submit(fetch, cuisine, later)] = (cuisine, later)
+
+                cuisine_seen = seen.setdefault(cuisine, set())
+                for business in businesses:
+                    if business["id"] not in cuisine_seen:
+                        cuisine_seen.add(business["id"])
+                        yield to_restaurant(business, cuisine)
+
+
+def crawl(cuisines: Iterable[str], location: str, limit: int = 240, max_workers: int = MAX_WORKERS) -> Dict[str, List[Dict]]:
+    """Fetch up to limit restaurants for every cuisine, all pages in parallel."""
+    cuisines = list(cuisines)
+    results = {cuisine: [] for cuisine in cuisines}
+    for restaurant in crawl_stream(cuisines, location, limit, max_workers):
+        results[restaurant["cuisine"]].append(restaurant)
+
+    return results
+
+
+def get_restaurants(cuisine: str, location: str, limit: int = 240) -> List[Dict]:
+    return crawl([cuisine], location, limit)[cuisine]